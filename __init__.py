@@ -17,28 +17,38 @@
 
 from adapt.intent import IntentBuilder
 from mycroft import intent_handler
-from mycroft.skills.core import MycroftSkill
+from mycroft.skills.core import FallbackSkill
 from mycroft.util.log import getLogger
+from mycroft.util.format import join_list
 
 import os
 from os.path import dirname, join
 import requests
 import ipaddress
-import json
 import re
 import mycroft.version
 from threading import Thread, Lock
+from time import perf_counter
 from mycroft.messagebus.client import MessageBusClient
 from mycroft.messagebus.message import Message
 from mycroft.util.log import LOG
 from mycroft.tts import TTS
 from mycroft.client.speech.listener import RecognizerLoop
 
+from .mirror_client import MIRROR_PORT
+from .connection_manager import CONNECTED, DISCONNECTED
+from .command_scheduler import DEBOUNCE, wait_all
+from .number_parser import parse_brightness
+from .metrics import Metrics, timed
+from .scenes import SCENES_FILE, load_scenes
+from .module_catalog import SPOKEN_NAME_FIELDS, UNSPACED_LANGUAGES, load_catalog
+from .mirrors import Mirror, IP_FILE, load_mirror_addresses, save_mirror_addresses, target_patterns
+
 __author__ = 'dmwilsonkc'
 
 LOGGER = getLogger(__name__)
 
-class MagicMirrorVoiceControlSkill(MycroftSkill):
+class MagicMirrorVoiceControlSkill(FallbackSkill):
 
     def __init__(self):
         super(MagicMirrorVoiceControlSkill, self).__init__(name="MagicMirrorVoiceControlSkill")
@@ -47,11 +57,11 @@ class MagicMirrorVoiceControlSkill(MycroftSkill):
 # MMM-Remote-Control requires the module identifier to know which module to
 # perform ModuleActionKeywords on (HIDE|SHOW). This code parses the MODULE_DATA returned from
 # the MMM-Remote-Control and compares it to the file "AvailableModules.json"
-# It then creates another file called file "AvailableModulesWithIdentifier.json"
+# It then creates another file called file "AvailableModulesWithIdentifier.json" in the skill's data folder
 # To store the module identifier that matches the ModuleKeyword. Modules identifiers may change
 # depending on their order in the MagicMirror config.js file. Everytime you install a new module
-# the module identifiers may change. If you run into issues, restart MagicMirror and Mycroft,
-# and this code should update the changed module identifiers.
+# the module identifiers may change. The skill polls MODULE_DATA in the background, and again
+# whenever a command fails, and updates the changed module identifiers without a restart.
 
 # The if statements match what Mycroft hears to a module. For instance a user would say
 # weather but if MMM-WunderGround is installed it would be considered "weather".
@@ -59,155 +69,290 @@ class MagicMirrorVoiceControlSkill(MycroftSkill):
 # For example: search for "weather" in the file "AvailableModules.json" and change it's
 # mycroftname to something other than weather like 'weather old'or 'current weather'.
 # Then search for MMM-Wunderground and change it's mycroftname to 'weather'.
-# The change must be to a module name that is also reflected in the ModuleKeywords.voc
-# otherwise mycroft will not recognize the name.
+# There is no ModuleKeywords.voc, the skill registers the mycroftname (or mycroftnamethai) of every
+# installed module with Mycroft itself, so the change is picked up the next time the skill connects.
 
 # ///////////DO NOT CHANGE THE FILE "AvailableModulesWithIdentifier.json"//////////////////
-# The "AvailableModulesWithIdentifier.json" file is recreated everytime the skill initiates.
+# The "AvailableModulesWithIdentifier.json" file is recreated whenever "AvailableModules.json" or the modules
+# installed on the mirror change, otherwise it is loaded as is when the skill initiates.
 # For your changes to persist all modifications should be made to the file "AvailableModules.json"
     def initialize(self):
-        self.url = 'http://0.0.0.0:8080/remote'
-        self.voiceurl ='http://0.0.0.0:8080/kalliope'
         self.mycroft_utterance=''
-        self.moduleData = ''
-        self.connectionStatus = ''
-        self.kalliopeStatus = ''
-        self.ipAddress = ''
-        self._dir = '/opt/mycroft/skills/magic-mirror-voice-control-skill'
-
-        # Look for the ip address of the MagicMirror in the ip.json file. If for some reason the ip address is incorrect,
-        # or the MagicMirror is unreachable (not on, not properly whitelisted, or some other connectivity issue) the request.get in the
-        # following code will catch the exception and prompt the user to take action. Not sure if this can be done with an If...Then statement.
+        self.moduleVocabulary = set()
+        self.sceneVocabulary = set()
+        self._vocabularyLock = Lock()
+        # Timings of every intent handler and every request to the mirrors, with counters for failures and timeouts.
+        # A snapshot is sent back in reply to a 'magicmirror.metrics' message on the messagebus.
+        self.metrics = Metrics()
+        # The folder the skill is installed in, normally /opt/mycroft/skills/magic-mirror-voice-control-skill
+        self._dir = dirname(__file__)
+
+        # Open a list of Available Modules. (This should be updated occasionally based on new available modules)
+        # Submit a PR if you'd like me to add new modules to the 'AvailableModules.json'
+        # It is compiled into the skill's data folder the first time and after every change, see module_catalog.Catalog
+        self.catalog = load_catalog(join(self._dir, 'AvailableModules.json'), self.file_system.path)
+        self.sceneDefinitions = load_scenes(join(self._dir, SCENES_FILE))
+
+        # Look for the ip address of the MagicMirror, or of each of the MagicMirrors, in the ip.json file. Every mirror
+        # gets its own client, connection manager, module identifiers and Kalliope forwarder (see mirrors.py).
+        # Mirrors connect in the background so one that is switched off does not hold up loading the skill. If for some
+        # reason an ip address is incorrect, or a MagicMirror is unreachable (not on, not properly whitelisted, or some
+        # other connectivity issue) its connection manager will fail to connect and handle_connection_state will
+        # prompt the user to take action.
+        self.mirrors = []
         try:
-            with open (join(self._dir, 'ip.json')) as f:
-                ip = json.load(f)
-            ipAddress = ip['ipAddress']
-            self.ipAddress = ipAddress
-            self.url = 'http://' + ipAddress + ':8080/remote'
-            self.voiceurl = 'http://' + ipAddress + ':8080/kalliope'
-            self.mycroft_utterance = ''
-            payload = {'action': 'MODULE_DATA'}
-            # Following line of code requests the module data so Mycroft knows which modules are installed
-            # If the MagicMirror is not reached, this request will cause an exception
-            r = requests.get(url=self.url, params=payload)
-            data = r.json()
-
-            # Open a list of Available Modules. (This should be updated occasionally based on new available modules)
-            # Submit a PR if you'd like me to add new modules to the 'AvailableModules.json'
-            with open (join(self._dir, 'AvailableModules.json')) as f:
-                AvailableData = json.load(f)
-
-            # Check to see which of the Available Modules have an 'identifier' by checking the 'data' requested from the mirror.
-            # Modules with 'identifiers' are installed and configured in the MagicMirror's config.js. As new modules are added to the
-            # config.js, module identifiers may change. If you add new modules to the MagicMirror, this skill needs to be restarted
-            # to update the module identifiers or odd things are possible
-            for moduleData in AvailableData['moduleData']:
-                for item in data['moduleData']:
-                    if moduleData['name'] == item['name']:
-                        moduleData['identifier'] = item['identifier']
-            self.moduleData = AvailableData
-
-            # Added code to see if kalliope module is installed. if not, there is no need to send events to kalliope module
-            data = self.moduleData
-            for moduleData in data['moduleData']:
-                mycroftname = moduleData['mycroftname']
-                identifier = moduleData['identifier']
-                if mycroftname == 'kalliope':
-                    if identifier != '':
-                        self.kalliopeStatus = 'installed'
-                    else:
-                        self.kalliopeStatus = 'not installed'
-            # Set connection status to connected and inform the user
-            self.connectionStatus = 'connected'
-            self.speak('I have successfully connected to the magic mirror.')
-
-        except requests.exceptions.ConnectionError:
-            # If the connection error is because the ip address has not changed from the default
-            if ipAddress == '0.0.0.0':
-                self.connectionStatus = 'disconnected'
-                self.speak('I was unable to connect to the magic mirror at the default ip address. To activate the magic-mirror-voice-control-skill I need to know the I P address of the magic mirror. What is the I P address of the magic mirror you would like to control with your voice?', expect_response=True)
-
-            else:
-                self.connectionStatus = 'disconnected'
-                self.speak_dialog('not.connected')
-
+            addresses = load_mirror_addresses(join(self._dir, IP_FILE))
         except IOError:
-            self.connectionStatus = 'disconnected'
+            addresses = []
             self.speak('To activate the magic-mirror-voice-control-skill I need to know the I P address of the magic mirror. What is the I P address of the magic mirror you would like to control with your voice', expect_response=True)
+        # Kalliope display updates are queued and sent from a background worker so a slow mirror
+        # never holds up the messagebus thread. With the kalliope_stream setting on they go over one
+        # WebSocket to the mirror instead of a POST each, if the mirror has one.
+        stream = str(self.settings.get('kalliope_stream', False)).lower() == 'true'
+        # Commands to the same module, or to the pages, that come in quick succession are collapsed into their net
+        # effect before they are sent, see command_scheduler.py. command_debounce is how long, in seconds, a command
+        # waits for the next one.
+        try:
+            debounce = float(self.settings.get('command_debounce', DEBOUNCE))
+        except (TypeError, ValueError):
+            debounce = DEBOUNCE
+        for address in addresses:
+            self.mirrors.append(Mirror(address['name'], address['ipAddress'], address['port'], self.catalog,
+                                       self.file_system.path, self.sceneDefinitions, self.lang, self.metrics,
+                                       stream=stream, debounce=debounce, on_update=self.update_installed_modules,
+                                       on_state_change=self.handle_connection_state))
+        # 'hide the clock on the hallway mirror' is only sent to the hallway mirror
+        self.targetPatterns = target_patterns([mirror.name for mirror in self.mirrors], self.lang)
+        # Until a mirror has said which modules it has, or an earlier run has cached it, Mycroft listens for every
+        # module name in the catalog and every scene, so commands (and the intent tests) work without a mirror
+        if not any(mirror.installed is not None for mirror in self.mirrors):
+            self.register_names(self.catalog.by_spoken.get(self.lang, {}),
+                                [scene.get(SPOKEN_NAME_FIELDS.get(self.lang)) for scene in self.sceneDefinitions])
+        for mirror in self.mirrors:
+            mirror.start()
 
         self.add_event('recognizer_loop:wakeword', self.handle_listen)
         self.add_event('recognizer_loop:utterance', self.handle_utterance)
         self.add_event('speak', self.handle_speak)
         self.add_event('recognizer_loop:audio_output_start', self.handle_output)
         self.add_event('recognizer_loop:audio_output_end', self.handle_output_end)
+        self.add_event('magicmirror.metrics', self.handle_metrics)
 
+        # Near misses of module names, see handle_module_fallback. It runs after Padatious and the general fallbacks
+        # of other skills, only the low confidence Padatious matches and 'I don't understand' come after it.
+        self.moduleActionPattern = self.action_pattern(join(self._dir, 'vocab', self.lang, 'ModuleActionKeywords.voc'))
+        self.register_fallback(self.handle_module_fallback, 80)
+
+    def action_pattern(self, path):
+        # Any of the actions in a .voc file, longest first so 'turn off' wins over a shorter action it contains
+        try:
+            with open(path) as f:
+                actions = sorted(set(line.strip() for line in f if line.strip()), key=len, reverse=True)
+        except IOError:
+            return None
+        if not actions:
+            return None
+        pattern = '|'.join(re.escape(action) for action in actions)
+        if self.lang not in UNSPACED_LANGUAGES:
+            pattern = r'\b(?:{})\b'.format(pattern)
+        return re.compile(pattern)
+
+    def handle_metrics(self, message):
+        self.bus.emit(message.response(self.metrics.snapshot()))
+
+    def handle_connection_state(self, mirror, previous, state):
+        # Inform the user the first time a mirror is found, or not found, after the skill loads
+        if previous == '':
+            if state == CONNECTED:
+                if mirror.name:
+                    self.speak('I have successfully connected to the {} magic mirror.'.format(mirror.name))
+                else:
+                    self.speak('I have successfully connected to the magic mirror.')
+            elif state == DISCONNECTED:
+                self.handle_not_connected([mirror])
+
+    def update_installed_modules(self, mirror):
+        # Everything that depends on which modules are installed on a mirror, run whenever its moduleIndex changes.
+        # ModuleKeywords are not read from a .voc file. The spoken names of the modules that are installed on the
+        # mirrors are registered with Adapt, so Mycroft doesn't take a command for a module the mirrors don't have.
+        # Names are added as new modules show up. Adapt can't forget a single keyword, so a module removed from the
+        # mirror stays registered and is answered with the No.Such.Module dialog. Scene names are registered the same way.
+        self.register_names(mirror.moduleIndex.installed_names(self.lang), mirror.scenes)
+
+    def register_names(self, modules, scenes):
+        with self._vocabularyLock:
+            for name in modules:
+                if name not in self.moduleVocabulary:
+                    self.register_vocabulary(name, 'ModuleKeywords')
+                    self.moduleVocabulary.add(name)
+            for name in scenes:
+                if name and name not in self.sceneVocabulary:
+                    self.register_vocabulary(name, 'SceneKeywords')
+                    self.sceneVocabulary.add(name)
+
+    def find_target(self, utterance):
+        # The mirrors a command is for, and the utterance without the mirror in it. 'hide the clock on the hallway mirror'
+        # is only for the hallway mirror, a command that doesn't name one is for all of them.
+        for pattern in self.targetPatterns:
+            match = pattern.search(utterance)
+            if match is not None:
+                name = match.group('mirror')
+                return ([mirror for mirror in self.mirrors if mirror.name == name],
+                        utterance[:match.start()] + utterance[match.end():])
+        return self.mirrors, utterance
+
+    def kalliope_mirrors(self):
+        return [mirror for mirror in self.mirrors
+                if mirror.connection.available() and mirror.kalliopeStatus == 'installed']
+
+    @timed('event.recognizer_loop:wakeword')
     def handle_listen(self, message):
-        if self.connectionStatus == 'connected':
-            if self.kalliopeStatus == 'installed':
-                voice_payload = {"notification":"KALLIOPE", "payload": "Listening"}
-                r = requests.post(url=self.voiceurl, data=voice_payload)
+        for mirror in self.kalliope_mirrors():
+            mirror.kalliope.send('KALLIOPE', 'Listening')
 
+    @timed('event.recognizer_loop:utterance')
     def handle_utterance(self, message):
-        if self.connectionStatus == 'connected':
-            if self.kalliopeStatus == 'installed':
-                utterance = message.data.get('utterances')
-                voice_payload = {"notification":"KALLIOPE", "payload": utterance}
-                r = requests.post(url=self.voiceurl, data=voice_payload)
+        # utterances is a list of transcriptions, MMM-kalliope shows the first one. Made a string here so the POST
+        # and the stream carry the same thing.
+        utterance = (message.data.get('utterances') or [''])[0]
+        for mirror in self.kalliope_mirrors():
+            mirror.kalliope.send('KALLIOPE', utterance)
 
+    @timed('event.speak')
     def handle_speak(self, message):
-        if self.connectionStatus == 'connected':
-            if self.kalliopeStatus == 'installed':
-                self.mycroft_utterance = message.data.get('utterance')
-                voice_payload = {"notification":"KALLIOPE", "payload": self.mycroft_utterance}
-                r = requests.post(url=self.voiceurl, data=voice_payload)
+        self.mycroft_utterance = message.data.get('utterance')
+        for mirror in self.kalliope_mirrors():
+            mirror.kalliope.send('KALLIOPE', self.mycroft_utterance)
 
+    @timed('event.recognizer_loop:audio_output_start')
     def handle_output(self, message):
-        if self.connectionStatus == 'connected':
-            if self.kalliopeStatus == 'installed':
-                voice_payload = {"notification":"KALLIOPE", "payload": self.mycroft_utterance}
-                r = requests.post(url=self.voiceurl, data=voice_payload)
+        for mirror in self.kalliope_mirrors():
+            mirror.kalliope.send('KALLIOPE', self.mycroft_utterance)
 
+    @timed('event.recognizer_loop:audio_output_end')
     def handle_output_end(self, message):
-        if self.connectionStatus == 'connected':
-            if self.kalliopeStatus == 'installed':
-                voice_payload = {"notification":"REMOVE_MESSAGE", "payload": "REMOVE_MESSAGE"}
-                r = requests.post(url=self.voiceurl, data=voice_payload)
+        for mirror in self.kalliope_mirrors():
+            mirror.kalliope.send('REMOVE_MESSAGE', 'REMOVE_MESSAGE')
 
-    def handle_not_connected(self):
-        if self.ipAddress == '0.0.0.0':
+    def handle_not_connected(self, mirrors=None):
+        mirrors = mirrors if mirrors is not None else self.mirrors
+        if not mirrors or any(mirror.ipAddress == '0.0.0.0' for mirror in mirrors):
             self.speak('I was unable to connect to the magic mirror at the default ip address. To activate the magic-mirror-voice-control-skill I need to know the I P address of the magic mirror. What is the I P address of the magic mirror you would like to control with your voice?', expect_response=True)
 
+        elif len(self.mirrors) > 1:
+            self.speak_dialog('mirror.not.connected', {'mirror': join_list([mirror.name for mirror in mirrors], 'and')})
         else:
             self.speak_dialog('not.connected')
 
+    def available(self, mirrors):
+        return any(mirror.connection.available() for mirror in mirrors)
+
+    def dispatch(self, plan):
+        # Sends requests to MMM-Remote-Control and tells the user how it went. plan is a list of (mirror, payloads,
+        # modules), modules are the spoken names of the modules the payloads are for, if any, so a failure can say
+        # which ones did not work. The requests go through each mirror's command scheduler, which may send them
+        # together with other commands to the same modules, see command_scheduler.py.
+        # With the optimistic_acknowledgment setting on, 'success' is spoken straight away and the requests are sent in
+        # the background. The user only hears from the skill again if a mirror reports an error or does not answer.
+        if str(self.settings.get('optimistic_acknowledgment', False)).lower() == 'true':
+            self.speak_dialog('success')
+            thread = Thread(target=self.send_and_report, args=(plan, True))
+            thread.daemon = True
+            thread.start()
+        else:
+            self.send_and_report(plan, False)
+
+    def send_and_report(self, plan, acknowledged):
+        # Every mirror gets its requests at the same time: they are all handed to the mirrors' schedulers before
+        # waiting for any of them, so the wait is that of the slowest mirror and a slow or dead one never holds up
+        # the others. A mirror that is known to be down fails straight away.
+        submitted = [(mirror, modules, self.submit(mirror, payloads)) for mirror, payloads, modules in plan]
+        sent = [(mirror, modules, None if futures is None else wait_all(futures))
+                for mirror, modules, futures in submitted]
+        failed = []
+        unreachable = []
+        reason = ''
+        for mirror, modules, results in sent:
+            if results is None or all(isinstance(status, Exception) for payload, status in results):
+                unreachable.append(mirror)
+                continue
+            refresh = False
+            for i, (payload, status) in enumerate(results):
+                module = modules[i] if modules else None
+                if isinstance(status, Exception):
+                    failed.append(module)
+                elif status['status'] != 'success':
+                    failed.append(module)
+                    reason = status.get('reason', '').replace('_', ' ')
+                    refresh = True
+            if refresh and modules:
+                # The identifier may be stale because config.js changed, fetch MODULE_DATA again now
+                mirror.connection.refresh()
+        modules = [module for mirror, payloads, names in plan for module in (names or [])]
+        if len(unreachable) == len(plan):
+            self.handle_not_connected(unreachable)
+            return
+        if not failed:
+            if not acknowledged:
+                self.speak_dialog('success')
+        elif not modules:
+            self.speak('There was an error processing your request. The error was caused by {}'.format(reason))
+        elif len(set(modules)) == 1:
+            self.speak_dialog('No.Such.Module')
+        else:
+            failed = [module for i, module in enumerate(failed) if module not in failed[:i]]
+            self.speak_dialog('modules.failed', {'modules': join_list(failed, 'and')})
+        if unreachable:
+            self.handle_not_connected(unreachable)
+
+    def submit(self, mirror, payloads):
+        try:
+            return mirror.scheduler.submit_all(payloads)
+        except requests.exceptions.RequestException:
+            return None
+
 # The following intent handler is used to set the ip address of the MagicMirror by saving it to a file ip.json
 # The file is saved into the skill's directory which causes Mycroft to reload the skill. After the skill reloads
 # the above initialize self code will find the ip.json file and load the MagicMirror ip address. If it is not the
 # correct address, or if the MagicMirror is not accessible the initilize self code will prompt the user to check the ip address
+# With several mirrors in ip.json the command has to say which one, 'set the hallway mirror ip address 192.168.X.X'
 
 #VOICE SET IP ADDRESS
     @intent_handler(IntentBuilder('SetMirrorIpAddress').require('SetIpKeywords').optionally('IpAddress'))
+    @timed('intent.SetMirrorIpAddress')
     def handle_Set_Ip_command(self, message):
         keywords = message.data.get('SetIpKeywords')
-        utterance = message.data['utterance']
+        mirrors, utterance = self.find_target(message.data['utterance'])
+        if len(mirrors) > 1:
+            self.speak_dialog('which.mirror', expect_response=True)
+            return
         utterance = utterance.replace(keywords, '')
+        # Taking the mirror out of 'set the hallway mirror ip address ...' can leave part of the keywords behind
+        digit = re.search(r'\d', utterance)
+        if digit is not None:
+            utterance = utterance[digit.start():]
         utterance = utterance.replace(' ', '')
         self.speak('I am setting the I P address to {}'.format(utterance))
         try:
             ipaddress.ip_address(utterance)
-            ip = {'ipAddress': utterance}
-            with open (join(self._dir,'ip.json'), 'w') as f:
-                json.dump(ip, f)
+            addresses = [{'name': mirror.name, 'ipAddress': mirror.ipAddress, 'port': mirror.port}
+                         for mirror in self.mirrors] or [{'name': '', 'port': MIRROR_PORT}]
+            for address in addresses:
+                if not mirrors or address['name'] == mirrors[0].name:
+                    address['ipAddress'] = utterance
+            save_mirror_addresses(join(self._dir, IP_FILE), addresses)
         except:
             self.speak('Im sorry that is not a valid ip address. please try again', expect_response=True)
 
 
 #!!! = not include for now
 # !!! This code builds the SystemActionIntent which are commands that are not directed at a specific module
-"""
+    """
     @intent_handler(IntentBuilder('SystemActionIntent').require('SystemActionKeywords').require('SystemKeywords'))
+    @timed('intent.SystemActionIntent')
     def handle_System_command(self, message):
-        if self.connectionStatus == 'connected':
+        mirrors, utterance = self.find_target(message.data.get('utterance', ''))
+        if self.available(mirrors):
 
             system_action = message.data.get('SystemActionKeywords')
             if system_action in ('hide', 'conceal'):
@@ -254,43 +399,36 @@ class MagicMirrorVoiceControlSkill(MycroftSkill):
                     system_action = 'NOTIFICATION'
                     System = 'ARTICLE_LESS_DETAILS'
                 payload = {'action': system_action, 'notification': System}
-            r = requests.get(url=self.url, params=payload)
-            status = r.json()
-            response = status['status']
-            if response == 'success':
-                self.speak_dialog('success')
-            else:
-                reason = status['reason']
-                reason = reason.replace('_', ' ')
-                self.speak('There was an error processing your request. The error was caused by', reason)
+            self.dispatch([(mirror, [payload], None) for mirror in mirrors])
         else:
-            self.handle_not_connected()
-"""
+            self.handle_not_connected(mirrors)
+    """
 
 # !!! This intent will have mycroft read the installed modules 'mycroftname' so that the user knows which mdules are installed
-"""
+    """
     @intent_handler(IntentBuilder('ListInstalledModulesIntent').require('ListInstalledKeywords').require('SingleModuleKeywords'))
+    @timed('intent.ListInstalledModulesIntent')
     def handle_list_installed_modules_command(self, message):
-        if self.connectionStatus == 'connected':
-            data = self.moduleData
+        mirrors, utterance = self.find_target(message.data.get('utterance', ''))
+        if self.available(mirrors):
             installed_modules = ''
-            for moduleData in data['moduleData']:
-                mycroftname = moduleData['mycroftname']
-                identifier = moduleData['identifier']
-                if identifier != "":
+            for mirror in mirrors:
+                for mycroftname in mirror.moduleIndex.installed_names('en-us'):
                     installed_modules = installed_modules + ', ' + mycroftname
             self.speak('The currently installed modules are{}'.format(installed_modules))
         else:
-            self.handle_not_connected()
-"""
+            self.handle_not_connected(mirrors)
+    """
 
 # PAGE
-# !!! This intent handles change page commands to be used with the MMM-pages module. The MMM-pages module must be installed
+# This intent handles change page commands to be used with the MMM-pages module. The MMM-pages module must be installed
 # for this intent to work. Find it on github @ https://github.com/edward-shen/MMM-pages
-"""
+# Page commands go through each mirror's command scheduler, a burst of them is sent as its net move, see coalesce().
     @intent_handler(IntentBuilder('ChangePagesIntent').require('PageActionKeywords').require('PageKeywords'))
+    @timed('intent.ChangePagesIntent')
     def handle_change_pages_command(self, message):
-        if self.connectionStatus == 'connected':
+        mirrors, utterance = self.find_target(message.data.get('utterance', ''))
+        if self.available(mirrors):
             page = message.data.get('PageKeywords')
             if page in ('one', '1', 'home'):
                 integer = 0
@@ -315,105 +453,58 @@ class MagicMirrorVoiceControlSkill(MycroftSkill):
             notification = 'PAGE_CHANGED'
             action = 'NOTIFICATION'
             payload = {'action': action, 'notification': notification, 'payload': integer}
-            r = requests.get(url=self.url, params=payload)
-            status = r.json()
-            response = status['status']
-            if response == 'success':
-                self.speak_dialog('success')
-            else:
-                reason = status['reason']
-                reason = reason.replace('_', ' ')
-                self.speak('There was an error processing your request. The error was caused by', reason)
+            self.dispatch([(mirror, [payload], None) for mirror in mirrors])
         else:
-            self.handle_not_connected()
-"""
+            self.handle_not_connected(mirrors)
 
 
-# !!! This intent handles swipe commands to be used with the MMM-pages module. The MMM-pages module must be installed
+# This intent handles swipe commands to be used with the MMM-pages module. The MMM-pages module must be installed
 # for the swipe intent to work. Find it on github @ https://github.com/edward-shen/MMM-pages
-"""
+# 'next page' and 'previous page' are swipes too.
     @intent_handler(IntentBuilder('HandleSwipeIntent').require('SwipeActionKeywords').require('LeftRightKeywords'))
+    @timed('intent.HandleSwipeIntent')
     def handle_pages_command(self, message):
-        if self.connectionStatus == 'connected':
+        mirrors, utterance = self.find_target(message.data.get('utterance', ''))
+        if self.available(mirrors):
             direction = message.data.get('LeftRightKeywords')
-            if direction == 'right':
+            if direction in ('right', 'previous', 'back'):
                 System = 'PAGE_DECREMENT'
-            if direction == 'left':
+            if direction in ('left', 'next'):
                 System = 'PAGE_INCREMENT'
             action = 'NOTIFICATION'
             payload = {'action': action, 'notification': System}
-            r = requests.get(url=self.url, params=payload)
-            status = r.json()
-            response = status['status']
-            if response == 'success':
-                self.speak_dialog('success')
-            else:
-                reason = status['reason']
-                reason = reason.replace('_', ' ')
-                self.speak('There was an error processing your request. The error was caused by', reason)
+            self.dispatch([(mirror, [payload], None) for mirror in mirrors])
         else:
-            self.handle_not_connected()
-"""
+            self.handle_not_connected(mirrors)
 
-# !!! This intent handles a number of different user utterances for the brightness value, including
+# This intent handles a number of different user utterances for the brightness value, including
 # numbers, numbers followed by %, numbers as words, numbers as words including the word percent.
 # Not all references need to include (%|percent), this can be a value between 10 - 200
-"""
-    @intent_handler(IntentBuilder('AdjustBrightnessIntent').require('BrightnessActionKeywords').require('BrightnessValueKeywords'))
+# Adapt cuts the regex/en-us/BrightnessValueKeywords.rx capture short at any word another vocabulary also has
+# ('one', 'percent'...), and drops it altogether when the value is only such a word ('ten', '10'). So the capture is
+# optional and the value is read from the utterance itself, everything after the BrightnessActionKeywords, and turned
+# into a number by number_parser. Values outside of 10 - 200 are clamped.
+    @intent_handler(IntentBuilder('AdjustBrightnessIntent').require('BrightnessActionKeywords').optionally('BrightnessValueKeywords'))
+    @timed('intent.AdjustBrightnessIntent')
     def handle_adjust_brightness_command(self, message):
-        if self.connectionStatus == 'connected':
+        mirrors, utterance = self.find_target(message.data.get('utterance', ''))
+        if self.available(mirrors):
             action = 'BRIGHTNESS'
-            value = message.data.get('BrightnessValueKeywords')
-            value_without_spaces = value.replace(' ', '')
-            iswords = str.isalpha(value_without_spaces)
-            # Sometimes Mycroft recognizes numbers as words, if that is the case, this code recognizes the words and looks
-            # in the 'numberwords.json' file for the corresponding number value. It also checks to see if the user uttered
-            # the word 'percent' and handles adjusting the value as a percentage.
-            if iswords == True:
-                percent_present = re.search('percent', value)
-                if percent_present is not None:
-                    value = value.replace(' percent', '')
-                    with open(join(self._dir, 'numberwords.json')) as f:
-                        data = json.load(f)
-                        for item in data['numberwords']:
-                            if value == item['word']:
-                                value = item['number']
-                                break
-                    value = ((value/100)*200)
-                else:
-                    # If the user does not use the word percent, and Mycroft recognized the numbers as words.
-                    with open(join(self._dir, 'numberwords.json')) as f:
-                        data = json.load(f)
-                        for item in data['numberwords']:
-                            if value == item['word']:
-                                value = item['number']
-                                break
-
+            # 'brightness 50 on the hallway mirror', find_target has already taken the mirror out of utterance
+            keywords = message.data.get('BrightnessActionKeywords', '').lower()
+            heard = utterance.lower()
+            if keywords and keywords in heard:
+                heard = heard.split(keywords, 1)[1]
             else:
-                # This else handles numbers including numbers with the '%' sign
-                percent_present = (re.search('%', value))
-                if percent_present is not None:
-                    value = (re.sub('[%]', '', value))
-                    value = int(value)
-                    value = ((value/100)*200)
-                    action = 'BRIGHTNESS'
-                    if value < 10:
-                        value = 10
-                else:
-                    value = int(value)
+                heard = self.find_target(message.data.get('BrightnessValueKeywords', ''))[1]
+            value = parse_brightness(heard)
+            if value is None:
+                self.speak_dialog('incorrect_command', expect_response=True)
+                return
             payload = {'action': action, 'value': value}
-            r = requests.get(url=self.url, params=payload)
-            status = r.json()
-            response = status['status']
-            if response == 'success':
-                self.speak_dialog('success')
-            else:
-                reason = status['reason']
-                reason = reason.replace('_', ' ')
-                self.speak('There was an error processing your request. The error was caused by', reason)
+            self.dispatch([(mirror, [payload], None) for mirror in mirrors])
         else:
-            self.handle_not_connected()
-"""
+            self.handle_not_connected(mirrors)
 
 
 # This intent handles commands directed at specific modules. Commands include: hide
@@ -423,72 +514,141 @@ class MagicMirrorVoiceControlSkill(MycroftSkill):
 # set up to be another way to say install the module.
 
     @intent_handler(IntentBuilder('ModuleActionIntent').require('ModuleActionKeywords').require('ModuleKeywords'))
+    @timed('intent.ModuleActionIntent')
     def handle_module_command(self, message):
-        #if self.connectionStatus == 'connected':
-            module_action = message.data.get('ModuleActionKeywords')
-
-            if self.language == 'th-th':
-                if module_action in ('ซ่อน', 'ปิด'):
-                    module_action = 'HIDE'
-                if module_action in ('โชว์', 'เปิด', 'แสดง'):
-                    module_action = 'SHOW'
-            if self.language == 'en-us':
-                if module_action in ('hide', 'conceal', 'turn off'):
-                    module_action = 'HIDE'
-                if module_action in ('show', 'display', 'turn on'):
-                    module_action = 'SHOW'
-
-            module = message.data.get('ModuleKeywords')
-            data = self.moduleData
-            for item in data['moduleData']:
-                if self.language == 'th-th':
-                    if module == item['mycroftnamethai']:
-                        module_id = item['identifier']
-                        module_url = item['URL']
-                        module_name =item['name']
-                if self.language == 'en-us':
-                    if module == item['mycroftname']:
-                        module_id = item['identifier']
-                        module_url = item['URL']
-                        module_name =item['name']
-                  
-                
-
-
+        mirrors, utterance = self.find_target(message.data.get('utterance', ''))
+        if self.available(mirrors):
+            self.module_command(mirrors, utterance, message.data.get('ModuleActionKeywords'),
+                                message.data.get('ModuleKeywords'))
+        else:
+            self.handle_not_connected(mirrors)
+
+# Speech to text doesn't always get a module name right, 'hide the wonder ground'. ModuleActionIntent needs a
+# ModuleKeywords, so Adapt leaves these alone and they reach the fallbacks. This fallback only claims an utterance
+# with a hide or show action in it when what follows the action is close enough to a module installed on the mirrors,
+# 'turn off the lights' is left for other skills.
+    @timed('fallback.ModuleAction')
+    def handle_module_fallback(self, message):
+        mirrors, utterance = self.find_target(message.data.get('utterance', ''))
+        match = self.moduleActionPattern.search(utterance) if self.moduleActionPattern else None
+        if match is None or self.module_action(match.group(0)) not in ('HIDE', 'SHOW'):
+            return False
+        heard = utterance[match.end():]
+        if not any(mirror.moduleIndex.resolve(heard, self.lang) for mirror in mirrors):
+            return False
+        if self.available(mirrors):
+            self.module_command(mirrors, utterance, match.group(0), None)
+        else:
+            self.handle_not_connected(mirrors)
+        return True
+
+    def module_action(self, module_action):
+        if self.lang == 'th-th':
+            if module_action in ('ซ่อน', 'ปิด'):
+                module_action = 'HIDE'
+            if module_action in ('โชว์', 'เปิด', 'แสดง'):
+                module_action = 'SHOW'
+        if self.lang == 'en-us':
+            if module_action in ('hide', 'conceal', 'turn off'):
+                module_action = 'HIDE'
+            if module_action in ('show', 'display', 'turn on'):
+                module_action = 'SHOW'
+        return module_action.upper()
+
+    def module_command(self, mirrors, utterance, spoken_action, module):
+        module_action = self.module_action(spoken_action)
+
+        # One utterance can name several modules, 'hide clock calendar and weather'. They are all looked up on every
+        # mirror the command is for, each mirror has its own identifiers, and the requests are sent to all of them at
+        # the same time, then a single response is spoken.
+        found = False
+        plan = []
+        for mirror in mirrors:
+            start = perf_counter()
+            targets = self.find_modules(mirror.moduleIndex, utterance, module, spoken_action)
+            self.metrics.observe('catalog.lookup', perf_counter() - start)
+            found = found or bool(targets)
+            # Only the modules that are not already hidden (or shown) are sent to the mirror
+            pending = []
+            for module_name, record in targets:
+                payload = {'action': module_action, 'module': record.identifier}
+                if mirror.scheduler.needs(payload):
+                    pending.append((module_name, payload))
+            if pending:
+                plan.append((mirror, [payload for name, payload in pending], [name for name, payload in pending]))
+        if not found:
+            self.speak_dialog('No.Such.Module')
+            return
+        if not plan:
+            self.speak_dialog('success')
+            return
+
+        """
+        if module_action in ('HIDE', 'SHOW'):
             module_action = module_action.upper()
             payload = {'action': module_action, 'module': module_id}
-
-            """
-            if module_action in ('HIDE', 'SHOW'):
-                module_action = module_action.upper()
-                payload = {'action': module_action, 'module': module_id}
-            if module_action in ('install', 'add'):
-                module_action = 'INSTALL'
-                payload = {'action': module_action, 'url': module_url}
-            if module_action == 'update':
-                module_action = module_action.upper()
-                payload = {'action': module_action, 'module': module_name}
-            """
-
-            r = requests.get(url=self.url, params=payload)
-            status = r.json()
-            response = status['status']
-            if response == 'success':
+        if module_action in ('install', 'add'):
+            module_action = 'INSTALL'
+            payload = {'action': module_action, 'url': module_url}
+        if module_action == 'update':
+            module_action = module_action.upper()
+            payload = {'action': module_action, 'module': module_name}
+        """
+
+        self.dispatch(plan)
+
+    def find_modules(self, index, utterance, module, spoken_action):
+        # Returns (spoken name, record) for every module installed on the mirror of index that the utterance names.
+        # When no installed module was heard exactly, a name registered for a module this mirror doesn't have or a near
+        # miss handed over by handle_module_fallback, whatever followed the action is matched against the fuzzy index
+        # of module names instead.
+        modules = index.find_all(utterance, self.lang) or ([module] if module else [])
+        targets = []
+        for module in modules:
+            record = index.lookup(module, self.lang)
+            if record is not None and record.identifier != '':
+                targets.append((module, record))
+        if not targets:
+            heard = utterance.split(spoken_action, 1)[-1]
+            for module in index.resolve(heard, self.lang):
+                targets.append((module, index.lookup(module, self.lang)))
+            if targets:
+                LOG.info('Heard {}, taking it for {}'.format(heard.strip(), ', '.join(m for m, r in targets)))
+        return targets
+
+# This intent applies a scene from Scenes.json, 'switch to night mode'. Only the modules that are not already
+# where the scene wants them are sent to the mirrors, all at the same time, and one response is spoken.
+    @intent_handler(IntentBuilder('SceneIntent').require('SceneActionKeywords').require('SceneKeywords').optionally('SceneTypeKeywords'))
+    @timed('intent.SceneIntent')
+    def handle_scene_command(self, message):
+        mirrors, utterance = self.find_target(message.data.get('utterance', ''))
+        if self.available(mirrors):
+            name = message.data.get('SceneKeywords')
+            if not any(name in mirror.scenes for mirror in mirrors):
+                self.speak_dialog('No.Such.Scene')
+                return
+            plan = []
+            for mirror in mirrors:
+                pending = [(module, payload) for module, payload in mirror.scenes.get(name, [])
+                           if mirror.scheduler.needs(payload)]
+                if pending:
+                    plan.append((mirror, [payload for module, payload in pending],
+                                 [module for module, payload in pending]))
+            if not plan:
                 self.speak_dialog('success')
-            else:
-                reason = status['reason']
-                reason = reason.replace('_', ' ')
-                self.speak_dialog('No.Such.Module')
-        #else:
-            #self.handle_not_connected()
-
-
-        @intent_handler()
-
+                return
+            self.dispatch(plan)
+        else:
+            self.handle_not_connected(mirrors)
 
     def stop(self):
         pass
 
+    def shutdown(self):
+        for mirror in self.mirrors:
+            mirror.stop()
+        super(MagicMirrorVoiceControlSkill, self).shutdown()
+
 
 def create_skill():
     return MagicMirrorVoiceControlSkill()
@@ -0,0 +1,214 @@
+from concurrent.futures import Future, ThreadPoolExecutor
+from threading import Lock, Timer
+
+import requests
+from mycroft.util.log import LOG
+
+from .connection_manager import MirrorUnavailable
+
+# How long, in seconds, a command waits for more commands to the same module (or to the pages, or the
+# brightness) before it is sent. By default it doesn't wait, a single command goes out straight away.
+# Commands that come in while an earlier one to the same thing is still on its way always wait for it
+# to come back, however long that takes, and are then sent as one.
+DEBOUNCE = 0.0
+
+# Most requests a mirror's scheduler sends at the same time. Matches the MirrorClient connection pool.
+MAX_WORKERS = 4
+
+PAGE_MOVES = {'PAGE_INCREMENT': 1, 'PAGE_DECREMENT': -1}
+
+
+def command_key(payload):
+    # Commands with the same key act on the same thing. They are sent one at a time in the order they came
+    # and the ones that queued up together are collapsed into their net effect first. None for commands that
+    # are sent as they come (SHUTDOWN, MONITORON...)
+    action = payload.get('action')
+    if action in ('HIDE', 'SHOW'):
+        return 'module', payload.get('module')
+    if action == 'BRIGHTNESS':
+        return 'brightness',
+    if action == 'NOTIFICATION' and (payload.get('notification') == 'PAGE_CHANGED'
+                                     or payload.get('notification') in PAGE_MOVES):
+        return 'pages',
+    return None
+
+
+def page_count(data):
+    # How many pages MMM-pages has on the mirror, from its config in MODULE_DATA. None if it is not installed.
+    for item in data['moduleData']:
+        if item.get('name') == 'MMM-pages':
+            config = item.get('config') or {}
+            return len(config['modules']) if config.get('modules') else None
+    return None
+
+
+def page_notification(notification, page):
+    return {'action': 'NOTIFICATION', 'notification': notification, 'payload': page}
+
+
+def coalesce(payloads, pages=None):
+    # The net effect of payloads, all with the same command_key. Returns the payloads to send, usually one.
+    #
+    # HIDE/SHOW, BRIGHTNESS and PAGE_CHANGED: the last one wins, HIDE -> SHOW -> HIDE is one HIDE.
+    # Page moves add up, moves that cancel out are not sent at all. The page the mirror is on is never assumed,
+    # it can be changed by touch or by another skill, so a PAGE_CHANGED is only sent when the batch has one.
+    # Moves after it are added to it when the number of pages is known, PAGE_CHANGED 3 then next page x2 on
+    # 5 pages is PAGE_CHANGED 0.
+    #
+    # What is left is sent as that many PAGE_INCREMENT or PAGE_DECREMENT without a payload. MMM-Remote-Control
+    # passes the payload of a GET on as a string and MMM-pages only moves by a number, it would move one page
+    # whatever the count. With a known number of pages the moves go the short way round, 4 on 5 pages is 1 back.
+    last = payloads[-1]
+    if command_key(last) != ('pages',):
+        return [last]
+    absolute, moves = None, 0
+    for payload in payloads:
+        if payload['notification'] == 'PAGE_CHANGED':
+            absolute, moves = int(payload['payload']), 0
+        else:
+            moves += PAGE_MOVES[payload['notification']] * int(payload.get('payload', 1))
+    if absolute is not None and (pages or moves == 0):
+        return [page_notification('PAGE_CHANGED', (absolute + moves) % pages if pages else absolute)]
+    if pages:
+        moves %= pages
+        if moves > pages // 2:
+            moves -= pages
+    sent = [] if absolute is None else [page_notification('PAGE_CHANGED', absolute)]
+    move = {'action': 'NOTIFICATION', 'notification': 'PAGE_INCREMENT' if moves > 0 else 'PAGE_DECREMENT'}
+    return sent + [dict(move) for i in range(abs(moves))]
+
+
+def wait_all(futures):
+    # Waits for the (payload, future) pairs from CommandScheduler.submit_all. Returns (payload, status) pairs in
+    # the order given, status is the exception raised for a request that failed.
+    results = []
+    for payload, future in futures:
+        try:
+            results.append((payload, future.result()))
+        except (requests.exceptions.RequestException, ValueError) as e:
+            results.append((payload, e))
+    return results
+
+
+class CommandScheduler(object):
+    # Every command to a mirror goes through its scheduler. Commands are queued by command_key, a queue is
+    # sent debounce seconds after its first command, or as soon as the request before it on the same key
+    # comes back, so there is never more than one request in flight per module and results can't arrive out
+    # of order. What queued up in the meantime is collapsed by coalesce() and sent as one go, 'next page,
+    # previous page, next page' while the mirror is slow to answer is a single PAGE_INCREMENT. Every command
+    # in the batch gets the same status. A HIDE/SHOW whose net effect the mirror already shows is
+    # answered with success without a request, see ModuleVisibility.
+    #
+    # Queues for different keys are sent at the same time, at most MAX_WORKERS at once.
+
+    def __init__(self, connection, visibility, debounce=DEBOUNCE, metrics=None):
+        self.connection = connection
+        self.visibility = visibility
+        self.debounce = debounce
+        self.metrics = metrics
+        # How many pages MMM-pages has, None if it isn't installed
+        self.pages = None
+        self.pending = {}
+        self.busy = set()
+        self._timers = {}
+        self._lock = Lock()
+        self._executor = ThreadPoolExecutor(max_workers=MAX_WORKERS)
+
+    def seed(self, data):
+        # Called with every MODULE_DATA, config.js may have changed
+        pages = page_count(data)
+        with self._lock:
+            self.pages = pages
+
+    def needs(self, payload):
+        # False only when the payload is a HIDE/SHOW the module is known to already be in and nothing else
+        # is queued for it
+        with self._lock:
+            key = command_key(payload)
+            if key in self.pending or key in self.busy:
+                return True
+        return self.visibility.needs(payload)
+
+    def submit(self, payload):
+        # Returns a Future of the status the mirror answered with, or of the exception the request raised
+        key = command_key(payload)
+        if key is None:
+            return self._executor.submit(self.connection.remote, payload)
+        future = Future()
+        with self._lock:
+            self.pending.setdefault(key, []).append((payload, future))
+            if key not in self.busy and key not in self._timers:
+                if self.debounce <= 0:
+                    self.busy.add(key)
+                    self._executor.submit(self._drain, key)
+                else:
+                    timer = self._timers[key] = Timer(self.debounce, self._start, (key,))
+                    timer.daemon = True
+                    timer.start()
+        return future
+
+    def submit_all(self, payloads):
+        # Queues payloads without waiting for them, returns (payload, future) pairs for wait_all
+        if not self.connection.available():
+            raise MirrorUnavailable('The magic mirror at {} is not reachable'.format(
+                self.connection.client.ipAddress))
+        return [(payload, self.submit(payload)) for payload in payloads]
+
+    def send_all(self, payloads):
+        return wait_all(self.submit_all(payloads))
+
+    def stop(self):
+        with self._lock:
+            for timer in self._timers.values():
+                timer.cancel()
+            self._timers = {}
+            pending, self.pending = self.pending, {}
+        for batch in pending.values():
+            for payload, future in batch:
+                future.set_exception(MirrorUnavailable('The skill is shutting down'))
+        self._executor.shutdown(wait=False)
+
+    def _start(self, key):
+        with self._lock:
+            self._timers.pop(key, None)
+            if key in self.busy:
+                return
+            self.busy.add(key)
+        self._executor.submit(self._drain, key)
+
+    def _drain(self, key):
+        # Sends the queue for key, then whatever queued up for it while that was on its way, until it is empty
+        while True:
+            with self._lock:
+                batch = self.pending.pop(key, None)
+                if not batch:
+                    self.busy.discard(key)
+                    return
+            try:
+                self._send(key, batch)
+            except Exception as e:
+                LOG.exception('Magic mirror scheduler failed on {}'.format(key))
+                for payload, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+
+    def _send(self, key, batch):
+        with self._lock:
+            payloads = coalesce([payload for payload, future in batch], self.pages)
+        if self.metrics is not None and len(batch) > 1:
+            self.metrics.increment('scheduler.coalesced')
+        payloads = [payload for payload in payloads if self.visibility.needs(payload)]
+        status = {'status': 'success'}
+        try:
+            for payload in payloads:
+                status = self.connection.remote(payload)
+                self.visibility.record(payload, status)
+                if status.get('status') != 'success':
+                    break
+        except (requests.exceptions.RequestException, ValueError) as e:
+            LOG.debug('Magic mirror request {} failed: {}'.format(payloads, e))
+            for payload, future in batch:
+                future.set_exception(e)
+            return
+        for payload, future in batch:
+            future.set_result(status)
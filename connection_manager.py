@@ -0,0 +1,154 @@
+from threading import Thread, Event, Lock
+
+import requests
+from mycroft.util.log import LOG
+
+# connectionStatus values. 'degraded' means recent requests have failed but not enough of them
+# in a row to give up on the mirror, requests are still sent.
+CONNECTED = 'connected'
+DEGRADED = 'degraded'
+DISCONNECTED = 'disconnected'
+
+# The probe only has to tell whether the mirror is there, it should not wait long to find out.
+PROBE_TIMEOUT = (2, 5)
+
+# How often, in seconds, MODULE_DATA is polled while connected to pick up config.js changes
+REFRESH_INTERVAL = 300
+
+
+class MirrorUnavailable(requests.exceptions.ConnectionError):
+    # Raised without touching the network while the mirror is known to be down. It is a
+    # ConnectionError so the handlers treat it the same way as a real failed connection.
+    pass
+
+
+class ConnectionManager(object):
+    # Keeps track of whether the MagicMirror can be reached and reconnects in the background.
+    #
+    # Every request made through remote() updates a small state machine:
+    #   None         - nothing has been heard from the mirror yet, the first probe is still running
+    #   connected    - the last request succeeded
+    #   degraded     - one or more requests in a row failed, fewer than failure_threshold
+    #   disconnected - failure_threshold requests in a row failed, the circuit is open
+    # Requests are sent in every state but disconnected, so a command given while the first probe is
+    # still waiting on the mirror goes through instead of being turned down. While disconnected,
+    # remote() raises MirrorUnavailable immediately so a voice command fails in milliseconds instead
+    # of waiting on a TCP timeout. A background thread probes the mirror with MODULE_DATA, backing
+    # off exponentially between attempts, and closes the circuit again once the mirror answers.
+    #
+    # While connected the same thread polls MODULE_DATA every refresh_interval seconds, or straight
+    # away when refresh() is called, so identifier changes on the mirror are picked up without a
+    # restart. on_module_data is called with the MODULE_DATA of every successful probe and poll.
+
+    def __init__(self, client, on_module_data=None, on_state_change=None,
+                 failure_threshold=3, min_backoff=1, max_backoff=60, refresh_interval=REFRESH_INTERVAL):
+        self.client = client
+        self.on_module_data = on_module_data
+        self.on_state_change = on_state_change
+        self.failure_threshold = failure_threshold
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.refresh_interval = refresh_interval
+        self.state = None
+        self.failures = 0
+        self._lock = Lock()
+        self._wake = Event()
+        self._running = False
+        self._thread = None
+
+    def start(self):
+        self._running = True
+        self._thread = Thread(target=self._run, name='MirrorConnectionManager')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=1)
+
+    def refresh(self):
+        # Ask the background thread to fetch MODULE_DATA now instead of at the next interval
+        self._wake.set()
+
+    def available(self):
+        return self.state != DISCONNECTED
+
+    def connected(self):
+        return self.state in (CONNECTED, DEGRADED)
+
+    def remote(self, payload, timeout=None):
+        if not self.available():
+            raise MirrorUnavailable('The magic mirror at {} is not reachable'.format(self.client.ipAddress))
+        try:
+            status = self.client.remote(payload, timeout=timeout)
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+            self.record_failure()
+            raise
+        self.record_success()
+        return status
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self._set_state(CONNECTED)
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.failures >= self.failure_threshold:
+                self._set_state(DISCONNECTED)
+                self._wake.set()
+            elif self.state == CONNECTED:
+                self._set_state(DEGRADED)
+
+    def _set_state(self, state):
+        if state == self.state:
+            return
+        LOG.info('Magic mirror connection {} -> {}'.format(self.state, state))
+        self.state = state
+        if self.on_state_change is not None:
+            self.on_state_change(state)
+
+    def _probe(self):
+        try:
+            data = self.client.module_data(timeout=PROBE_TIMEOUT, retry=False)
+            if self.on_module_data is not None:
+                self.on_module_data(data)
+            return True
+        except (requests.exceptions.RequestException, ValueError, KeyError, IOError) as e:
+            LOG.debug('Magic mirror probe failed: {}'.format(e))
+            return False
+
+    def _refresh(self):
+        try:
+            data = self.remote({'action': 'MODULE_DATA'}, timeout=PROBE_TIMEOUT)
+            if self.on_module_data is not None:
+                self.on_module_data(data)
+        except (requests.exceptions.RequestException, ValueError, KeyError, IOError) as e:
+            LOG.debug('Magic mirror module refresh failed: {}'.format(e))
+
+    def _run(self):
+        backoff = self.min_backoff
+        delay = 0
+        while self._running:
+            self._wake.wait(delay)
+            self._wake.clear()
+            if not self._running:
+                return
+            if self.connected():
+                self._refresh()
+                delay = self.refresh_interval
+                continue
+            if self._probe():
+                with self._lock:
+                    self.failures = 0
+                    self._set_state(CONNECTED)
+                backoff = self.min_backoff
+                delay = self.refresh_interval
+            else:
+                with self._lock:
+                    self._set_state(DISCONNECTED)
+                delay = backoff
+                backoff = min(backoff * 2, self.max_backoff)
@@ -0,0 +1,145 @@
+import re
+import sys
+from collections import defaultdict
+
+# How alike, from 0 to 1, what was heard has to be to a module name to be taken for it. The score is
+# the Dice coefficient of their n-grams, 'news feeds' against 'news feed' is 0.8, 'wonder ground'
+# against 'wunder ground' 0.78, while 'news' against 'news feed' is only 0.6.
+MATCH_THRESHOLD = 0.7
+
+# What separates several modules in one command, 'hide the clock and the calendar'
+SEPARATORS = {
+    'en-us': re.compile(r'\s*(?:,|\band\b)\s*'),
+    'th-th': re.compile(r'\s*(?:,|และ|กับ)\s*'),
+}
+
+# Words around a module name that are not part of it
+FILLERS = {
+    'en-us': re.compile(r'^(?:the\s+)+|\s+(?:please|now)$'),
+    'th-th': re.compile(r'^โมดูล|(?:ครับ|ค่ะ|คะ|นะ|หน่อย|ด้วย|จ้ะ|จ้า)+$'),
+}
+
+# English spellings that sound the same, applied in order to each word. After the first letter the
+# vowels are dropped and doubled letters collapsed, 'wonder' and 'wunder' both become 'wndr'.
+PHONETIC_RULES = [(re.compile(pattern), replacement) for pattern, replacement in (
+    (r'ph', 'f'),
+    (r'ck|q', 'k'),
+    (r'c(?=[eiy])', 's'),
+    (r'c', 'k'),
+    (r'x', 'ks'),
+    (r'z', 's'),
+    (r'(?<=.)[aeiouywh]', ''),
+    (r'(.)\1+', r'\1'),
+)]
+
+# Tone marks and the silent consonant mark are often wrong or missing in what Thai speech to text
+# writes, they are ignored
+THAI_MARKS = re.compile('[\u0e47-\u0e4e]')
+
+NON_WORD = re.compile(r'[^\w]+')
+SPACES = re.compile(r'\s+')
+
+
+def phonetic_key(word):
+    for pattern, replacement in PHONETIC_RULES:
+        word = pattern.sub(replacement, word)
+    return word
+
+
+def ngrams(text, n):
+    text = ' {} '.format(text)
+    return set(text[i:i + n] for i in range(len(text) - n + 1))
+
+
+def spoken_module_name(name):
+    # The spoken form of a MagicMirror module name, 'MMM-WunderGround' -> 'wunder ground'
+    name = re.sub(r'^MMM-', '', name)
+    name = re.sub(r'([a-z0-9])([A-Z])', r'\1 \2', name)
+    return NON_WORD.sub(' ', name.replace('_', ' ')).strip().lower()
+
+
+class FuzzyNameIndex(object):
+    # An inverted index from n-gram to the names containing it, built once per language when the
+    # catalog is loaded. A lookup only touches the names that share an n-gram with what was heard,
+    # counting the shared ones gives the Dice coefficient without comparing any two strings.
+    #
+    # entries are (text, name) pairs. text is what is indexed, name what a match returns, so a name
+    # can be found by more than one text ('weather' by 'weather' and by 'wunder ground'). Names in a
+    # language written without spaces (unspaced) are compared on character bigrams of the whole name,
+    # the others on trigrams of the spelling plus trigrams of a rough phonetic key of each word.
+
+    def __init__(self, entries, language, unspaced=False):
+        self.language = language
+        self.unspaced = unspaced
+        self.names = []
+        self.sizes = []
+        self.postings = defaultdict(list)
+        seen = set()
+        for text, name in entries:
+            if (text, name) in seen:
+                continue
+            seen.add((text, name))
+            grams = self.grams(text)
+            if not grams:
+                continue
+            key = len(self.names)
+            self.names.append(name)
+            self.sizes.append(len(grams))
+            for gram in grams:
+                self.postings[gram].append(key)
+        self.postings = dict(self.postings)
+
+    def state(self):
+        # What restore() needs, as plain tuples and dicts so it can be stored with the compiled catalog
+        return (tuple(self.names), tuple(self.sizes),
+                dict((gram, tuple(keys)) for gram, keys in self.postings.items()))
+
+    @classmethod
+    def restore(cls, state, language, unspaced=False):
+        index = cls((), language, unspaced)
+        names, sizes, postings = state
+        index.names = [sys.intern(name) for name in names]
+        index.sizes = list(sizes)
+        index.postings = postings
+        return index
+
+    def grams(self, text):
+        text = text.lower()
+        if self.unspaced:
+            return ngrams(THAI_MARKS.sub('', SPACES.sub('', text)), 2)
+        words = NON_WORD.sub(' ', text).split()
+        grams = ngrams(' '.join(words), 3)
+        # The phonetic n-grams are told apart from the spelled ones by an upper case marker
+        grams.update('P' + gram for gram in ngrams(' '.join(phonetic_key(word) for word in words), 3))
+        return grams
+
+    def best(self, text, accept=None, threshold=MATCH_THRESHOLD):
+        # Returns (name, score) of the closest name accept() agrees to, or (None, 0.0) if none reaches threshold
+        grams = self.grams(text)
+        shared = defaultdict(int)
+        for gram in grams:
+            for key in self.postings.get(gram, ()):
+                shared[key] += 1
+        name, score = None, 0.0
+        for key, count in shared.items():
+            candidate = 2.0 * count / (len(grams) + self.sizes[key])
+            if candidate >= threshold and candidate > score and (accept is None or accept(self.names[key])):
+                name, score = self.names[key], candidate
+        return name, score
+
+    def find_all(self, text, accept=None, threshold=MATCH_THRESHOLD):
+        # The closest name for each module in text, in the order they were said. 'the wonder ground and
+        # news feeds' -> ['weather', 'news feed']
+        separator = SEPARATORS.get(self.language)
+        filler = FILLERS.get(self.language)
+        parts = separator.split(text.strip()) if separator else [text.strip()]
+        found = []
+        for part in parts:
+            if filler:
+                part = filler.sub('', part)
+            if not part:
+                continue
+            name, score = self.best(part, accept, threshold)
+            if name is not None and name not in found:
+                found.append(name)
+        return found
@@ -0,0 +1,154 @@
+import json
+import socket
+from collections import deque
+from threading import Thread, Condition
+from time import perf_counter
+
+import requests
+from mycroft.util.log import LOG
+
+# websocket-client comes with mycroft-core (the messagebus client uses it), without it the
+# stream is simply not available and every notification is posted.
+try:
+    import websocket
+except ImportError:
+    websocket = None
+
+# Kalliope notifications are display updates, so a short timeout is plenty. If the mirror
+# can't take one in this time the next state will replace it anyway.
+KALLIOPE_TIMEOUT = (1, 2)
+
+# Transient states that are worth nothing once something else needs to be shown. A "Listening"
+# that is still waiting to be sent when the utterance arrives is replaced by the utterance.
+SUPERSEDED_PAYLOADS = ('Listening',)
+
+
+class StreamUnsupported(Exception):
+    pass
+
+
+class KalliopeStream(object):
+    # One long lived WebSocket to the mirror at /kalliope/stream instead of a form POST per
+    # notification. Every notification is one json text frame,
+    #
+    #   {"notification": "KALLIOPE", "payload": "Listening"}
+    #
+    # the same two fields the POST carries. Frames are not answered, so a chatty dialog costs
+    # the mirror's Node server a few bytes per event instead of a request it has to parse,
+    # route and reply to. The socket is opened on the first send and again after it drops, or
+    # when the mirror's address changes. A mirror that answers the upgrade with anything but
+    # 101 doesn't have the stream, send() then raises StreamUnsupported.
+
+    def __init__(self, client, timeout=KALLIOPE_TIMEOUT[1]):
+        self.client = client
+        self.timeout = timeout
+        self.url = None
+        self.socket = None
+
+    def send(self, notification, payload):
+        start = perf_counter()
+        try:
+            if self.socket is not None and self.url != self.client.streamurl:
+                self.close()
+            if self.socket is None:
+                self.url = self.client.streamurl
+                self.socket = websocket.create_connection(self.url, timeout=self.timeout)
+                self.client.metrics.increment('kalliope.stream.connects')
+            self.socket.send(json.dumps({'notification': notification, 'payload': payload}))
+        except websocket.WebSocketBadStatusException as e:
+            self.close()
+            raise StreamUnsupported(e)
+        except (websocket.WebSocketException, socket.error):
+            self.close()
+            self.client.metrics.increment('kalliope.stream.errors')
+            raise
+        finally:
+            self.client.metrics.observe('kalliope.stream.' + notification, perf_counter() - start)
+
+    def close(self):
+        if self.socket is not None:
+            try:
+                self.socket.close(timeout=0)
+            except (websocket.WebSocketException, socket.error):
+                pass
+            self.socket = None
+
+
+class KalliopeForwarder(object):
+    # The messagebus calls handle_listen, handle_utterance, handle_speak... on its own thread.
+    # Posting to the mirror from there holds up wakeword and TTS handling for the whole of
+    # Mycroft whenever the mirror is slow, so the handlers only queue the notification and this
+    # worker sends them to MMM-kalliope in order.
+    #
+    # The queue is bounded. When it is full the oldest notification is dropped, a mirror that
+    # has gone away can only ever cost us maxsize pending messages.
+    #
+    # With stream on the notifications go over a KalliopeStream. If the mirror doesn't have the
+    # stream the forwarder goes back to posting for good, if the stream drops the notification
+    # is posted and the stream reconnects on the next one.
+
+    def __init__(self, client, maxsize=16, stream=False):
+        self.client = client
+        self.dropped = 0
+        self.stream = None
+        if stream and websocket is None:
+            LOG.warning('websocket-client is not installed, posting Kalliope notifications instead of streaming them')
+        elif stream:
+            self.stream = KalliopeStream(client)
+        self._queue = deque(maxlen=maxsize)
+        self._last = None
+        self._running = True
+        self._cond = Condition()
+        self._thread = Thread(target=self._run, name='KalliopeForwarder')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def send(self, notification, payload):
+        message = (notification, payload)
+        with self._cond:
+            # speak and audio_output_start both show the same utterance, only send it once
+            if message == self._last:
+                return
+            if notification == 'KALLIOPE' and self._queue:
+                pending_notification, pending_payload = self._queue[-1]
+                if pending_notification == 'KALLIOPE' and pending_payload in SUPERSEDED_PAYLOADS:
+                    self._queue.pop()
+            if len(self._queue) == self._queue.maxlen:
+                self.dropped += 1
+            self._queue.append(message)
+            self._last = message
+            self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self._running and not self._queue:
+                    self._cond.wait()
+                if not self._running:
+                    return
+                notification, payload = self._queue.popleft()
+            self._forward(notification, payload)
+
+    def _forward(self, notification, payload):
+        if self.stream is not None:
+            try:
+                self.stream.send(notification, payload)
+                return
+            except StreamUnsupported as e:
+                LOG.info('The mirror has no Kalliope stream ({}), posting notifications instead'.format(e))
+                self.stream = None
+            except (websocket.WebSocketException, socket.error) as e:
+                LOG.debug('Kalliope stream dropped, posting {} instead: {}'.format(notification, e))
+        try:
+            self.client.kalliope(notification, payload, timeout=KALLIOPE_TIMEOUT)
+        except requests.exceptions.RequestException as e:
+            LOG.debug('Could not forward {} to kalliope: {}'.format(notification, e))
+
+    def stop(self):
+        with self._cond:
+            self._running = False
+            self._queue.clear()
+            self._cond.notify()
+        self._thread.join(timeout=1)
+        if self.stream is not None:
+            self.stream.close()
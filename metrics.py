@@ -0,0 +1,95 @@
+from bisect import bisect_left
+from functools import wraps
+from threading import Lock
+from time import perf_counter
+
+from mycroft.util.log import LOG
+
+# Upper bounds, in seconds, of the histogram buckets. Anything slower lands in the last one.
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# Anything slower than this, in seconds, is logged as a warning
+SLOW_CALL = 1.0
+
+
+class Histogram(object):
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect_left(BUCKETS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, p):
+        # Upper bound of the bucket the p-th percentile falls in, good enough to see where time goes
+        rank = p / 100.0 * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank and count:
+                return BUCKETS[i] if i < len(BUCKETS) else self.max
+        return 0.0
+
+    def snapshot(self):
+        return {
+            'count': self.count,
+            'mean': self.total / self.count if self.count else 0.0,
+            'max': self.max,
+            'p50': self.percentile(50),
+            'p95': self.percentile(95),
+            'p99': self.percentile(99),
+            'buckets': dict(zip([str(b) for b in BUCKETS] + ['+Inf'], self.counts)),
+        }
+
+
+class Metrics(object):
+    # In-process timings and counters for the intent handlers and every request to the mirror.
+    # Recording is a perf_counter() call and a few integer updates, the histograms are only turned
+    # into something readable when snapshot() is asked for, on 'magicmirror.metrics'.
+
+    def __init__(self, slow_call=SLOW_CALL):
+        self.slow_call = slow_call
+        self.histograms = {}
+        self.counters = {}
+        self._lock = Lock()
+
+    def observe(self, name, seconds):
+        with self._lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            histogram.observe(seconds)
+        if seconds > self.slow_call:
+            LOG.warning('Slow magic mirror call: {} took {:.2f}s'.format(name, seconds))
+
+    def increment(self, name):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'timings': dict((name, histogram.snapshot()) for name, histogram in self.histograms.items()),
+                'counters': dict(self.counters),
+            }
+
+
+def timed(name):
+    # Times a skill method into self.metrics under name
+    def decorator(func):
+        @wraps(func)
+        def wrapper(self, *args, **kwargs):
+            start = perf_counter()
+            try:
+                return func(self, *args, **kwargs)
+            finally:
+                self.metrics.observe(name, perf_counter() - start)
+        return wrapper
+    return decorator
@@ -0,0 +1,106 @@
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from .metrics import Metrics
+
+# MMM-Remote-Control and MMM-kalliope both listen on the MagicMirror's own web server.
+# All of the urls the skill talks to are built here, and only here.
+MIRROR_PORT = 8080
+REMOTE_PATH = '/remote'
+KALLIOPE_PATH = '/kalliope'
+KALLIOPE_STREAM_PATH = '/kalliope/stream'
+
+# (connect, read) timeouts in seconds. The connect timeout is kept short so a mirror that
+# is switched off is noticed quickly, the read timeout is longer because some actions
+# (MODULE_DATA on a large config.js for instance) take a while on a Raspberry Pi.
+DEFAULT_TIMEOUT = (3.05, 10)
+
+# MMM-Remote-Control uses GET for everything, so the http verb does not tell us whether a
+# request is safe to repeat. These actions leave the mirror in the same state no matter how
+# many times they are sent. Anything else (SHUTDOWN, REBOOT, PAGE_INCREMENT, INSTALL...) is
+# only ever sent once.
+IDEMPOTENT_ACTIONS = ('MODULE_DATA', 'HIDE', 'SHOW', 'BRIGHTNESS', 'MONITORON', 'MONITOROFF')
+IDEMPOTENT_NOTIFICATIONS = ('PAGE_CHANGED', 'ARTICLE_MORE_DETAILS', 'ARTICLE_LESS_DETAILS')
+
+
+def is_idempotent(payload):
+    action = payload.get('action')
+    if action == 'NOTIFICATION':
+        return payload.get('notification') in IDEMPOTENT_NOTIFICATIONS
+    return action in IDEMPOTENT_ACTIONS
+
+
+class MirrorClient(object):
+    # One MirrorClient is shared by every handler in the skill. It owns a requests Session so
+    # the TCP connection to the mirror is kept alive and reused between commands instead of
+    # being set up and torn down for every single request.
+
+    def __init__(self, ipAddress, port=MIRROR_PORT, timeout=DEFAULT_TIMEOUT,
+                 retries=2, backoff=0.25, pool_size=4, metrics=None):
+        self.metrics = metrics if metrics is not None else Metrics()
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.set_address(ipAddress, port)
+
+    def set_address(self, ipAddress, port=MIRROR_PORT):
+        self.ipAddress = ipAddress
+        self.port = port
+        base = 'http://{}:{}'.format(ipAddress, port)
+        self.url = base + REMOTE_PATH
+        self.voiceurl = base + KALLIOPE_PATH
+        self.streamurl = 'ws://{}:{}{}'.format(ipAddress, port, KALLIOPE_STREAM_PATH)
+
+    def remote(self, payload, timeout=None, retry=True):
+        # Sends an action to MMM-Remote-Control and returns the decoded json status.
+        # Idempotent actions are retried with a short backoff when the connection drops or
+        # times out, the last exception is raised if every attempt fails.
+        # Every call is timed as remote.<ACTION> (remote.NOTIFICATION.<notification> for notifications).
+        attempts = 1 + (self.retries if retry and is_idempotent(payload) else 0)
+        name = 'remote.' + payload.get('action', '')
+        if payload.get('action') == 'NOTIFICATION':
+            name += '.' + payload.get('notification', '')
+        start = time.perf_counter()
+        try:
+            for attempt in range(attempts):
+                try:
+                    r = self.session.get(url=self.url, params=payload, timeout=timeout or self.timeout)
+                    status = r.json()
+                    if status.get('status', 'success') != 'success':
+                        self.metrics.increment('remote.failures')
+                    return status
+                except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                    self.metrics.increment('remote.timeouts' if isinstance(e, requests.exceptions.Timeout)
+                                           else 'remote.errors')
+                    if attempt == attempts - 1:
+                        raise
+                    self.metrics.increment('remote.retries')
+                    time.sleep(self.backoff * (2 ** attempt))
+        finally:
+            self.metrics.observe(name, time.perf_counter() - start)
+
+    def module_data(self, timeout=None, retry=True):
+        return self.remote({'action': 'MODULE_DATA'}, timeout=timeout, retry=retry)
+
+    def kalliope(self, notification, payload, timeout=None):
+        # Kalliope notifications are fire and forget display updates, they are never retried.
+        voice_payload = {'notification': notification, 'payload': payload}
+        start = time.perf_counter()
+        try:
+            return self.session.post(url=self.voiceurl, data=voice_payload, timeout=timeout or self.timeout)
+        except requests.exceptions.Timeout:
+            self.metrics.increment('kalliope.timeouts')
+            raise
+        except requests.exceptions.RequestException:
+            self.metrics.increment('kalliope.errors')
+            raise
+        finally:
+            self.metrics.observe('kalliope.' + notification, time.perf_counter() - start)
+
+    def close(self):
+        self.session.close()
@@ -0,0 +1,157 @@
+import json
+import re
+
+from mycroft.util.log import LOG
+
+from .mirror_client import MirrorClient, MIRROR_PORT
+from .kalliope_forwarder import KalliopeForwarder
+from .connection_manager import ConnectionManager
+from .command_scheduler import CommandScheduler, DEBOUNCE
+from .scenes import compile_scenes
+from .module_catalog import (ModuleIndex, ModuleVisibility, mirror_fingerprint, installed_identifiers, diff_identifiers,
+                             load_cached_identifiers, save_cached_identifiers)
+
+# ip.json holds a single mirror, {"ipAddress": "192.168.1.20", "port": 8080}, or a list of named ones:
+#
+#   {"mirrors": [{"name": "hallway", "ipAddress": "192.168.1.20"},
+#                {"name": "kitchen", "ipAddress": "192.168.1.21", "port": 8081}]}
+#
+# "port" is optional, MagicMirror listens on 8080 unless its config.js says otherwise. The single mirror
+# has no name.
+IP_FILE = 'ip.json'
+
+# How a command names the mirror it is for, 'hide the clock on the hallway mirror'. Tried in order, {names}
+# is replaced by the names of the mirrors.
+TARGET_PATTERNS = {
+    'en-us': (r'\s*\b(?:(?:on|in|at|for) )?(?:the )?(?P<mirror>{names}) mirror\b',
+              r'\s*\b(?:on|in|at) (?:the )?(?P<mirror>{names})\b'),
+    'th-th': (r'\s*(?:ที่|บน|ใน)?\s*กระจก\s*(?P<mirror>{names})',
+              r'\s*(?:ที่|บน|ใน)\s*(?P<mirror>{names})'),
+}
+
+
+def load_mirror_addresses(path):
+    # Returns a list of {'name', 'ipAddress', 'port'}, one per mirror in ip.json
+    with open(path) as f:
+        ip = json.load(f)
+    return [{'name': entry.get('name', '').lower(), 'ipAddress': entry['ipAddress'],
+             'port': entry.get('port', MIRROR_PORT)}
+            for entry in ip.get('mirrors', [ip])]
+
+
+def save_mirror_addresses(path, addresses):
+    entries = []
+    for address in addresses:
+        entry = {'ipAddress': address['ipAddress']}
+        if address.get('name'):
+            entry['name'] = address['name']
+        if address.get('port', MIRROR_PORT) != MIRROR_PORT:
+            entry['port'] = address['port']
+        entries.append(entry)
+    with open(path, 'w') as f:
+        json.dump(entries[0] if len(entries) == 1 and 'name' not in entries[0] else {'mirrors': entries}, f)
+
+
+def target_patterns(names, language):
+    names = [name for name in names if name]
+    if not names:
+        return []
+    alternatives = '|'.join(re.escape(name) for name in sorted(names, key=len, reverse=True))
+    return [re.compile(pattern.format(names=alternatives)) for pattern in TARGET_PATTERNS.get(language, ())]
+
+
+class Mirror(object):
+    # Everything the skill knows about one MagicMirror. The same module has a different identifier on every
+    # mirror, depending on its place in that mirror's config.js, so each mirror resolves the catalog against
+    # its own MODULE_DATA and keeps its own index, scenes, connection state, record of hidden modules and command
+    # scheduler. The Catalog itself is shared by every mirror.
+    #
+    # on_update(mirror) is called whenever the modules installed on the mirror change and on_state_change(mirror,
+    # previous, state) whenever its connection state does, both on the mirror's connection manager thread.
+
+    def __init__(self, name, ipAddress, port, catalog, cache_dir, scene_definitions, language,
+                 metrics, stream=False, debounce=DEBOUNCE, on_update=None, on_state_change=None):
+        self.name = name
+        self.catalog = catalog
+        self.cacheDir = cache_dir
+        self.sceneDefinitions = scene_definitions
+        self.language = language
+        self.on_update = on_update
+        self.on_state_change = on_state_change
+        # Module name -> identifier of every module in the mirror's config.js, None until MODULE_DATA has been fetched
+        self.installed = None
+        self.moduleIndex = ModuleIndex(catalog)
+        self.visibility = ModuleVisibility()
+        self.scenes = {}
+        self.connectionStatus = ''
+        self.kalliopeStatus = ''
+        self.client = MirrorClient(ipAddress, port, metrics=metrics)
+        self.kalliope = KalliopeForwarder(self.client, stream=stream)
+        self.connection = ConnectionManager(self.client, on_module_data=self.handle_module_data,
+                                            on_state_change=self.handle_connection_state)
+        # Every command to the mirror is sent through the scheduler, see command_scheduler.CommandScheduler
+        self.scheduler = CommandScheduler(self.connection, self.visibility, debounce=debounce, metrics=metrics)
+        # If the catalog has already been resolved against this mirror on a previous run, and
+        # 'AvailableModules.json' has not changed since, the cached identifiers are loaded here, so the index,
+        # the scenes and the ModuleKeywords are ready without waiting for MODULE_DATA. The connection manager lets
+        # commands through while its first probe is running, so with the cache they work before the mirror answers.
+        cached, self.mirrorHash = load_cached_identifiers(cache_dir, catalog.fingerprint, name)
+        if cached is not None:
+            self.update_identifiers(cached)
+
+    @property
+    def ipAddress(self):
+        return self.client.ipAddress
+
+    @property
+    def port(self):
+        return self.client.port
+
+    def start(self):
+        self.connection.start()
+
+    def stop(self):
+        self.connection.stop()
+        self.scheduler.stop()
+        self.kalliope.stop()
+        self.client.close()
+
+    def handle_module_data(self, data):
+        # Runs every time the connection manager fetches MODULE_DATA. The first time the index is built from it,
+        # after that only the identifiers that actually changed are swapped into the index.
+        self.visibility.seed(data)
+        self.scheduler.seed(data)
+        mirrorHash = mirror_fingerprint(data)
+        if self.installed is None:
+            self.update_identifiers(installed_identifiers(data))
+        elif mirrorHash != self.mirrorHash:
+            self.installed = installed_identifiers(data)
+            changes = diff_identifiers(self.moduleIndex, data)
+            if changes:
+                LOG.info('Magic mirror {} module identifiers changed: {}'.format(self.name, changes))
+                self.moduleIndex = self.moduleIndex.updated(changes)
+                self.update_installed_modules()
+        else:
+            return
+        self.mirrorHash = mirrorHash
+        save_cached_identifiers(self.cacheDir, self.installed, self.catalog.fingerprint, mirrorHash, self.name)
+
+    def handle_connection_state(self, state):
+        previous = self.connectionStatus
+        self.connectionStatus = state
+        if self.on_state_change is not None:
+            self.on_state_change(self, previous, state)
+
+    def update_identifiers(self, installed):
+        self.installed = installed
+        self.moduleIndex = ModuleIndex(self.catalog, installed)
+        self.update_installed_modules()
+
+    def update_installed_modules(self):
+        # Added code to see if kalliope module is installed. if not, there is no need to send events to kalliope module
+        kalliope = self.moduleIndex.lookup('kalliope', 'en-us')
+        self.kalliopeStatus = 'installed' if kalliope is not None and kalliope.identifier != '' else 'not installed'
+        # Scenes from Scenes.json, resolved to the HIDE/SHOW requests for the modules installed on this mirror
+        self.scenes = compile_scenes(self.sceneDefinitions, self.moduleIndex, self.language)
+        if self.on_update is not None:
+            self.on_update(self)
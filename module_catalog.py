@@ -0,0 +1,374 @@
+import hashlib
+import json
+import marshal
+import os
+import re
+import struct
+import sys
+from threading import Lock
+from os.path import join
+
+from .fuzzy_names import FuzzyNameIndex, MATCH_THRESHOLD, spoken_module_name
+
+# Which field of an "AvailableModules.json" entry holds the name Mycroft hears, per language
+SPOKEN_NAME_FIELDS = {
+    'en-us': 'mycroftname',
+    'th-th': 'mycroftnamethai',
+}
+
+# Languages that are written without spaces between words. Module names are found anywhere in the
+# utterance for these, for the others a name has to start and end on a word boundary.
+UNSPACED_LANGUAGES = ('th-th',)
+
+# "AvailableModules.json" compiled to what the skill actually keeps in memory, stored in the skill's data
+# folder. It is used as long as the mtime and size of "AvailableModules.json" match the ones it was compiled
+# from, or its content hash does, and compiled again otherwise. Bump COMPILED_VERSION whenever the layout changes.
+# The file is the length of the columns, the columns and then the URLs, each written with marshal. It is read in
+# one go and decoded with marshal.loads, marshal.load on a file is several times slower.
+COMPILED_CATALOG = 'AvailableModules.compiled'
+COMPILED_VERSION = 1
+COLUMNS_LENGTH = struct.Struct('>I')
+
+
+def file_fingerprint(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+class Catalog(object):
+    # The module catalog as columns: the MagicMirror module names, and the spoken name of every module per language
+    # (None where there is none), one row per "AvailableModules.json" entry. Every name is interned, so the catalog,
+    # the identifiers of every mirror and Adapt's vocabulary all share the same strings. The fuzzy name indexes are
+    # part of the compiled catalog, and one catalog is shared by every mirror.
+    #
+    # The URLs are only needed to install a module. They stay on disk, after the columns in the compiled catalog,
+    # until url() is first called.
+
+    __slots__ = ('names', 'spoken', 'fuzzy', 'fingerprint', 'by_name', 'by_spoken', '_source', '_compiled',
+                 '_urls_at', '_urls')
+
+    def __init__(self, names, spoken, fuzzy, fingerprint, source, compiled=None, urls_at=None):
+        self.names = names
+        self.spoken = spoken
+        self.fuzzy = fuzzy
+        self.fingerprint = fingerprint
+        self._source = source
+        self._compiled = compiled
+        self._urls_at = urls_at
+        self._urls = None
+        # A few names appear more than once in the catalog. by_spoken maps a spoken name to all of its rows,
+        # by_name a module name to its first one.
+        self.by_name = {}
+        for row, name in enumerate(names):
+            self.by_name.setdefault(name, row)
+        self.by_spoken = {}
+        for language, column in spoken.items():
+            rows = {}
+            for row, name in enumerate(column):
+                if name is not None:
+                    rows[name] = rows.get(name, ()) + (row,)
+            self.by_spoken[language] = rows
+
+    def url(self, row):
+        if self._urls is None:
+            self._urls = self._load_urls()
+        return self._urls[row]
+
+    def _load_urls(self):
+        if self._compiled is not None:
+            try:
+                with open(self._compiled, 'rb') as f:
+                    f.seek(self._urls_at)
+                    fingerprint, urls = marshal.loads(f.read())
+                if fingerprint == self.fingerprint:
+                    return urls
+            except (IOError, EOFError, ValueError, TypeError):
+                pass
+        with open(self._source) as f:
+            return tuple(item.get('URL', '') for item in json.load(f)['moduleData'])
+
+
+def compile_catalog(source):
+    # Returns the compiled catalog in "AvailableModules.json" as (columns, urls), both plain tuples and dicts
+    # so they can be stored with marshal
+    with open(source, 'rb') as f:
+        raw = f.read()
+    items = json.loads(raw.decode('utf-8'))['moduleData']
+    names = tuple(sys.intern(item['name']) for item in items)
+    spoken = {}
+    fuzzy = {}
+    for language, field in SPOKEN_NAME_FIELDS.items():
+        column = tuple(sys.intern(item[field]) if item.get(field) else None for item in items)
+        heard = []
+        for name, spoken_name in zip(names, column):
+            if spoken_name is not None:
+                heard.append((spoken_name, spoken_name))
+                if language not in UNSPACED_LANGUAGES:
+                    heard.append((spoken_module_name(name), spoken_name))
+        spoken[language] = column
+        fuzzy[language] = FuzzyNameIndex(heard, language, language in UNSPACED_LANGUAGES).state()
+    stat = os.stat(source)
+    columns = {
+        'version': COMPILED_VERSION,
+        'mtime': stat.st_mtime_ns,
+        'size': stat.st_size,
+        'fingerprint': hashlib.sha1(raw).hexdigest(),
+        'names': names,
+        'spoken': spoken,
+        'fuzzy': fuzzy,
+    }
+    urls = tuple(item.get('URL', '') for item in items)
+    return columns, urls
+
+
+def load_catalog(source, cache_dir):
+    # Returns the Catalog of "AvailableModules.json", from the compiled copy in cache_dir when it is up to date.
+    # Otherwise the catalog is compiled and the compiled copy saved for next time.
+    compiled = join(cache_dir, COMPILED_CATALOG)
+    stat = os.stat(source)
+    try:
+        with open(compiled, 'rb') as f:
+            length, = COLUMNS_LENGTH.unpack(f.read(COLUMNS_LENGTH.size))
+            columns = marshal.loads(f.read(length))
+            urls_at = COLUMNS_LENGTH.size + length
+            if columns.get('version') == COMPILED_VERSION:
+                if (columns['mtime'], columns['size']) == (stat.st_mtime_ns, stat.st_size):
+                    return _catalog(columns, source, compiled, urls_at)
+                if columns['fingerprint'] == file_fingerprint(source):
+                    # Touched but not changed (a git checkout for instance), store the new mtime
+                    fingerprint, urls = marshal.loads(f.read())
+                    columns.update(mtime=stat.st_mtime_ns, size=stat.st_size)
+                    return _catalog(columns, source, compiled, _save_compiled(compiled, columns, urls))
+    except (IOError, EOFError, ValueError, TypeError, KeyError, AttributeError, struct.error):
+        pass
+    columns, urls = compile_catalog(source)
+    try:
+        urls_at = _save_compiled(compiled, columns, urls)
+    except IOError:
+        compiled = urls_at = None
+    return _catalog(columns, source, compiled, urls_at)
+
+
+def _catalog(columns, source, compiled, urls_at):
+    fuzzy = dict((language, FuzzyNameIndex.restore(state, language, language in UNSPACED_LANGUAGES))
+                 for language, state in columns['fuzzy'].items())
+    names = tuple(sys.intern(name) for name in columns['names'])
+    spoken = dict((language, tuple(sys.intern(name) if name is not None else None for name in column))
+                  for language, column in columns['spoken'].items())
+    return Catalog(names, spoken, fuzzy, columns['fingerprint'], source, compiled, urls_at)
+
+
+def _save_compiled(path, columns, urls):
+    # Returns where the urls start in the file
+    data = marshal.dumps(columns)
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(COLUMNS_LENGTH.pack(len(data)))
+        f.write(data)
+        f.write(marshal.dumps((columns['fingerprint'], urls)))
+    os.replace(tmp, path)
+    return COLUMNS_LENGTH.size + len(data)
+
+
+class ModuleRecord(object):
+    # Everything handle_module_command needs to know about a module once it has been matched. The URL is only
+    # read from the catalog when it is asked for.
+
+    __slots__ = ('identifier', 'name', '_catalog', '_row')
+
+    def __init__(self, identifier, name, catalog, row):
+        self.identifier = identifier
+        self.name = name
+        self._catalog = catalog
+        self._row = row
+
+    @property
+    def URL(self):
+        return self._catalog.url(self._row)
+
+
+class ModuleIndex(object):
+    # The catalog seen from one mirror: identifiers holds the identifier of every module in that mirror's
+    # config.js by module name, the rest comes from the shared Catalog. Lookups are dictionary lookups,
+    # records are made for the module that was asked for only.
+    #
+    # An index is never changed once built, updated() returns a new one, so handlers that already hold
+    # it are never half updated.
+
+    def __init__(self, catalog=None, identifiers=None):
+        self.catalog = catalog
+        self.identifiers = identifiers or {}
+        self._installed = {}
+        self._patterns = {}
+
+    def _row(self, rows):
+        # A few names appear more than once in the catalog. Take the installed one if there is one.
+        for row in rows:
+            if self.catalog.names[row] in self.identifiers:
+                return row
+        return rows[0]
+
+    def _record(self, row):
+        name = self.catalog.names[row]
+        return ModuleRecord(self.identifiers.get(name, ''), name, self.catalog, row)
+
+    def updated(self, changes):
+        # Returns a copy of the index with the identifiers in changes (name -> identifier, '' when a module
+        # has been removed from the mirror) swapped in
+        identifiers = dict(self.identifiers)
+        for name, identifier in changes.items():
+            if identifier:
+                identifiers[name] = identifier
+            else:
+                identifiers.pop(name, None)
+        return ModuleIndex(self.catalog, identifiers)
+
+    def installed_names(self, language):
+        # The names Mycroft should listen for in language, only those of modules installed on the mirror
+        names = self._installed.get(language)
+        if names is None:
+            names = []
+            if self.catalog is not None:
+                for spoken, rows in self.catalog.by_spoken.get(language, {}).items():
+                    if any(self.catalog.names[row] in self.identifiers for row in rows):
+                        names.append(spoken)
+            self._installed[language] = names
+        return names
+
+    def spoken_name(self, name, language):
+        row = self.catalog.by_name.get(name) if self.catalog is not None else None
+        if row is None:
+            return None
+        return self.catalog.spoken.get(language, ())[row]
+
+    def find_all(self, utterance, language):
+        # Returns the spoken names of every installed module mentioned in the utterance, in the order they
+        # were said. 'hide clock calendar and weather' -> ['clock', 'calendar', 'weather']
+        pattern = self._patterns.get(language)
+        if pattern is None:
+            names = sorted(self.installed_names(language), key=len, reverse=True)
+            if not names:
+                return []
+            alternatives = '|'.join(re.escape(name) for name in names)
+            if language not in UNSPACED_LANGUAGES:
+                alternatives = r'(?<!\w)(?:{})(?!\w)'.format(alternatives)
+            pattern = self._patterns[language] = re.compile(alternatives)
+        found = []
+        for name in pattern.findall(utterance):
+            if name not in found:
+                found.append(name)
+        return found
+
+    def resolve(self, text, language, threshold=MATCH_THRESHOLD):
+        # The spoken names of the installed modules closest to what was heard, for when find_all found none.
+        # Speech to text often gets close without getting it right, 'wonder ground', 'news feeds'...
+        fuzzy = self.catalog.fuzzy.get(language) if self.catalog is not None else None
+        if fuzzy is None:
+            return []
+        installed = set(self.installed_names(language))
+        return fuzzy.find_all(text, lambda name: name in installed, threshold)
+
+    def lookup(self, module, language):
+        rows = self.catalog.by_spoken.get(language, {}).get(module) if self.catalog is not None else None
+        if rows is None:
+            return None
+        return self._record(self._row(rows))
+
+    def lookup_name(self, name):
+        row = self.catalog.by_name.get(name) if self.catalog is not None else None
+        if row is None:
+            return None
+        return self._record(row)
+
+
+class ModuleVisibility(object):
+    # Which modules are currently hidden on the mirror, by identifier. Seeded from the 'hidden' flag in
+    # MODULE_DATA every time it is fetched and kept up to date with every HIDE/SHOW the mirror accepts,
+    # so a command that would not change anything is answered without a request to the mirror.
+
+    def __init__(self):
+        self.hidden = {}
+        self._lock = Lock()
+
+    def seed(self, data):
+        with self._lock:
+            self.hidden = dict((item['identifier'], bool(item.get('hidden', False))) for item in data['moduleData'])
+
+    def needs(self, payload):
+        # False only when the payload is a HIDE/SHOW the module is known to already be in
+        action = payload.get('action')
+        if action not in ('HIDE', 'SHOW'):
+            return True
+        with self._lock:
+            hidden = self.hidden.get(payload.get('module'))
+        return hidden is None or hidden != (action == 'HIDE')
+
+    def record(self, payload, status):
+        action = payload.get('action')
+        if action in ('HIDE', 'SHOW') and status.get('status') == 'success':
+            with self._lock:
+                self.hidden[payload.get('module')] = action == 'HIDE'
+
+
+# The identifiers a mirror's MODULE_DATA resolved to are persisted so a reload of the skill does not have
+# to wait on the mirror before it can take commands. They live in the skill's data folder rather than in the
+# skill folder itself, Mycroft reloads the skill whenever a file in the skill folder changes.
+# With several mirrors each one has its own, named after the mirror.
+CACHE_FILE = 'AvailableModulesWithIdentifier.json'
+
+
+def cache_file(mirror_name=''):
+    if not mirror_name:
+        return CACHE_FILE
+    return 'AvailableModulesWithIdentifier.{}.json'.format(re.sub(r'\W+', '_', mirror_name))
+
+
+def mirror_fingerprint(data):
+    # Only the name -> identifier pairs matter for the join, the rest of MODULE_DATA (position,
+    # hidden, config...) changes without invalidating the resolved catalog
+    installed = sorted((item['name'], item['identifier']) for item in data['moduleData'])
+    return hashlib.sha1(json.dumps(installed).encode('utf-8')).hexdigest()
+
+
+def installed_identifiers(data):
+    # Module name -> identifier of every module in a mirror's MODULE_DATA
+    return dict((sys.intern(item['name']), item['identifier']) for item in data['moduleData'])
+
+
+def diff_identifiers(index, data):
+    # Returns name -> identifier for every catalog module whose identifier on the mirror is not the
+    # one in the index, including modules that have been removed ('') or newly added to config.js
+    installed = installed_identifiers(data)
+    changes = {}
+    for name in index.catalog.by_name:
+        identifier = installed.get(name, '')
+        if identifier != index.identifiers.get(name, ''):
+            changes[name] = identifier
+    return changes
+
+
+def load_cached_identifiers(cache_dir, catalog_hash, mirror_name=''):
+    # Returns the cached identifiers and the fingerprint of the mirror they were resolved from, or
+    # (None, None) when there is no cache or "AvailableModules.json" has changed since.
+    try:
+        with open(join(cache_dir, cache_file(mirror_name))) as f:
+            cached = json.load(f)
+    except (IOError, ValueError):
+        return None, None
+    fingerprint = cached.get('fingerprint', {})
+    if fingerprint.get('catalog') != catalog_hash or 'identifiers' not in cached:
+        return None, None
+    return dict((sys.intern(name), identifier) for name, identifier in cached['identifiers'].items()), \
+        fingerprint.get('mirror')
+
+
+def save_cached_identifiers(cache_dir, identifiers, catalog_hash, mirror_hash, mirror_name=''):
+    cached = {
+        'fingerprint': {'catalog': catalog_hash, 'mirror': mirror_hash},
+        'identifiers': identifiers,
+    }
+    path = join(cache_dir, cache_file(mirror_name))
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(cached, f)
+    os.replace(tmp, path)
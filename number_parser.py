@@ -0,0 +1,85 @@
+import re
+
+# Spoken numbers are parsed with a few small word tables instead of looking every utterance up in
+# a list of every number written out as words. Everything here is built once, when the module is
+# imported, and parsing is a dictionary lookup per word.
+UNITS = {
+    'zero': 0, 'oh': 0, 'one': 1, 'two': 2, 'three': 3, 'four': 4, 'five': 5, 'six': 6,
+    'seven': 7, 'eight': 8, 'nine': 9, 'ten': 10, 'eleven': 11, 'twelve': 12, 'thirteen': 13,
+    'fourteen': 14, 'fifteen': 15, 'sixteen': 16, 'seventeen': 17, 'eighteen': 18, 'nineteen': 19,
+}
+TENS = {
+    'twenty': 20, 'thirty': 30, 'forty': 40, 'fifty': 50, 'sixty': 60, 'seventy': 70, 'eighty': 80,
+    'ninety': 90,
+}
+PERCENT_WORDS = ('percent', '%')
+
+TOKENS = re.compile(r'\d+(?:\.\d+)?|%|[a-z]+')
+
+# MMM-Remote-Control accepts BRIGHTNESS values from 10 to 200, 100 being the normal brightness.
+# A percentage is a percentage of the maximum.
+MIN_BRIGHTNESS = 10
+MAX_BRIGHTNESS = 200
+
+
+def parse_number(text):
+    # Returns (number, percent) for things like '85', '85%', 'eighty five percent',
+    # 'one hundred and twenty five', 'one oh five' or 'fifty five point five'. number is None when
+    # there is no number in the text.
+    total = 0
+    current = 0
+    found = False
+    percent = False
+    # digits: the last number word was a single digit, so a digit after it is the next digit of the
+    # number, 'one oh five' is 105. decimals: how many digits have been read after 'point', plus one.
+    digits = False
+    decimals = 0
+    for token in TOKENS.findall(text.lower().replace('per cent', 'percent')):
+        if token[0].isdigit():
+            current += float(token)
+            digits = False
+        elif token in UNITS:
+            value = UNITS[token]
+            if decimals and value < 10:
+                current += value / 10.0 ** decimals
+                decimals += 1
+            elif digits and value < 10:
+                current = current * 10 + value
+            else:
+                current += value
+            digits = value < 10
+        elif token in TENS:
+            # 'one fifty' or 'one twenty five', the hundred is left out
+            if 0 < current < 20:
+                current *= 100
+            current += TENS[token]
+            digits = False
+        elif token == 'hundred':
+            current = (current or 1) * 100
+            digits = False
+        elif token == 'thousand':
+            total += (current or 1) * 1000
+            current = 0
+            digits = False
+        elif token == 'point':
+            decimals = 1
+            continue
+        elif token in PERCENT_WORDS:
+            percent = True
+            continue
+        else:
+            continue
+        found = True
+    if not found:
+        return None, percent
+    return total + current, percent
+
+
+def parse_brightness(text):
+    # Turns the spoken brightness value into a BRIGHTNESS value MMM-Remote-Control accepts
+    value, percent = parse_number(text)
+    if value is None:
+        return None
+    if percent:
+        value = value / 100 * MAX_BRIGHTNESS
+    return int(round(min(max(value, MIN_BRIGHTNESS), MAX_BRIGHTNESS)))
@@ -0,0 +1,43 @@
+import json
+
+from mycroft.util.log import LOG
+
+from .module_catalog import SPOKEN_NAME_FIELDS
+
+# Scenes are layouts of the mirror, 'morning', 'night', 'guests'..., kept in "Scenes.json" next to
+# "AvailableModules.json". Each one names the modules to show and the modules to hide by their
+# MagicMirror module name, the same "name" as in "AvailableModules.json":
+#
+#   {"mycroftname": "night", "mycroftnamethai": "กลางคืน", "show": ["clock"], "hide": ["calendar", "newsfeed"]}
+SCENES_FILE = 'Scenes.json'
+
+
+def load_scenes(path):
+    try:
+        with open(path) as f:
+            return json.load(f)['scenes']
+    except IOError:
+        return []
+
+
+def compile_scenes(scenes, index, language):
+    # Resolves every scene against the modules installed on the mirror. Returns the spoken scene name
+    # mapped to a list of (spoken module name, payload) with one HIDE or SHOW payload per installed
+    # module. Modules that are not installed are left out.
+    field = SPOKEN_NAME_FIELDS.get(language)
+    compiled = {}
+    for scene in scenes:
+        name = scene.get(field)
+        if not name:
+            continue
+        actions = []
+        for action, modules in (('SHOW', scene.get('show', [])), ('HIDE', scene.get('hide', []))):
+            for module in modules:
+                record = index.lookup_name(module)
+                if record is None:
+                    LOG.warning('Scene {} uses {}, which is not in AvailableModules.json'.format(name, module))
+                elif record.identifier != '':
+                    actions.append((index.spoken_name(module, language) or module,
+                                    {'action': action, 'module': record.identifier}))
+        compiled[name] = actions
+    return compiled
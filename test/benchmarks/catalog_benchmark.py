@@ -0,0 +1,105 @@
+# Load time and resident memory of the module catalog: "AvailableModules.json" parsed with json, the way
+# the skill used to keep it, against the compiled Catalog (module_catalog.load_catalog).
+#
+#   python test/benchmarks/catalog_benchmark.py [iterations]
+#
+# json                the parsed file, every entry a dict with its URL and spoken names
+# json + fuzzy index  the above plus the fuzzy name indexes built from it, what a mirror used to hold
+# compile             load_catalog without a compiled copy, the first start and after every change
+# compiled            load_catalog from the compiled copy, every other start
+# compiled + URLs     the compiled catalog after a URL has been asked for
+#
+# Memory is what tracemalloc sees still allocated once the catalog is loaded. Doesn't need mycroft-core.
+
+import gc
+import json
+import os
+import shutil
+import sys
+import tempfile
+import timeit
+import tracemalloc
+import types
+from os.path import dirname, abspath, join
+
+SKILL_DIR = dirname(dirname(dirname(abspath(__file__))))
+CATALOG = join(SKILL_DIR, 'AvailableModules.json')
+
+# The skill's modules import each other relatively, load them as a package without running the skill's __init__.py
+package = types.ModuleType('magic_mirror_voice_control_skill')
+package.__path__ = [SKILL_DIR]
+sys.modules[package.__name__] = package
+
+from magic_mirror_voice_control_skill.fuzzy_names import FuzzyNameIndex, spoken_module_name  # noqa: E402
+from magic_mirror_voice_control_skill.module_catalog import (load_catalog, COMPILED_CATALOG,  # noqa: E402
+                                                             SPOKEN_NAME_FIELDS, UNSPACED_LANGUAGES)
+
+
+def load_json():
+    with open(CATALOG) as f:
+        return json.load(f)
+
+
+def load_json_and_index():
+    catalog = load_json()
+    fuzzy = {}
+    for language, field in SPOKEN_NAME_FIELDS.items():
+        heard = []
+        for item in catalog['moduleData']:
+            if item.get(field):
+                heard.append((item[field], item[field]))
+                if language not in UNSPACED_LANGUAGES:
+                    heard.append((spoken_module_name(item['name']), item[field]))
+        fuzzy[language] = FuzzyNameIndex(heard, language, language in UNSPACED_LANGUAGES)
+    return catalog, fuzzy
+
+
+def compile_fresh(cache_dir):
+    def run():
+        if os.path.exists(join(cache_dir, COMPILED_CATALOG)):
+            os.remove(join(cache_dir, COMPILED_CATALOG))
+        return load_catalog(CATALOG, cache_dir)
+    return run
+
+
+def with_urls(cache_dir):
+    def run():
+        catalog = load_catalog(CATALOG, cache_dir)
+        catalog.url(0)
+        return catalog
+    return run
+
+
+def resident(load):
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    kept = load()
+    gc.collect()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del kept
+    return after - before
+
+
+def main(iterations=50):
+    cache_dir = tempfile.mkdtemp()
+    try:
+        load_catalog(CATALOG, cache_dir)
+        cases = [
+            ('json', load_json),
+            ('json + fuzzy index', load_json_and_index),
+            ('compile', compile_fresh(cache_dir)),
+            ('compiled', lambda: load_catalog(CATALOG, cache_dir)),
+            ('compiled + URLs', with_urls(cache_dir)),
+        ]
+        print('{} catalog entries, {} iterations'.format(len(load_json()['moduleData']), iterations))
+        for name, load in cases:
+            seconds = min(timeit.repeat(load, number=iterations, repeat=3)) / iterations
+            print('{:<20} {:8.2f} ms {:8.1f} KiB'.format(name, seconds * 1e3, resident(load) / 1024.0))
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:2]])
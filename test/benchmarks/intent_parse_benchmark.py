@@ -0,0 +1,103 @@
+# Adapt parse latency with every catalog name registered as a ModuleKeyword (what the old
+# ModuleKeywords.voc did, and what the skill still does until a mirror has answered) against only
+# the modules installed on a typical mirror.
+#
+#   python test/benchmarks/intent_parse_benchmark.py [iterations]
+#
+# The utterances are the ones in test/intent, parsed against the skill's own intents. Needs
+# mycroft-core and adapt-parser.
+#
+# The number of ModuleKeywords makes no measurable difference, 0.66 - 0.70 ms/utterance with all
+# 339 names against 0.64 - 0.75 ms with 8 (50 iterations, two runs). Registering only the installed
+# modules is about not matching modules the mirror doesn't have, not about parse time.
+
+import glob
+import importlib.util
+import json
+import sys
+import tempfile
+import timeit
+from os.path import basename, dirname, abspath, join, splitext
+
+from adapt.engine import IntentDeterminationEngine
+from adapt.intent import IntentBuilder
+
+SKILL_DIR = dirname(dirname(dirname(abspath(__file__))))
+
+spec = importlib.util.spec_from_file_location('magic_mirror_voice_control_skill', join(SKILL_DIR, '__init__.py'),
+                                              submodule_search_locations=[SKILL_DIR])
+skill = importlib.util.module_from_spec(spec)
+sys.modules[spec.name] = skill
+spec.loader.exec_module(skill)
+
+from magic_mirror_voice_control_skill.module_catalog import ModuleIndex, load_catalog  # noqa: E402
+
+# MODULE_DATA of a mirror running the default MagicMirror config plus the modules this skill uses
+DEFAULT_MIRROR = ['alert', 'updatenotification', 'clock', 'calendar', 'compliments', 'currentweather',
+                  'weatherforecast', 'newsfeed', 'MMM-Remote-Control', 'MMM-kalliope']
+
+
+def skill_intents():
+    # The intents of the skill's handlers, the way Mycroft collects them
+    intents = []
+    for handler in vars(skill.MagicMirrorVoiceControlSkill).values():
+        for intent in getattr(handler, 'intents', []):
+            intents.append(intent.build() if isinstance(intent, IntentBuilder) else intent)
+    return intents
+
+
+def build_engine(module_names, language='en-us'):
+    engine = IntentDeterminationEngine()
+    for path in glob.glob(join(SKILL_DIR, 'vocab', language, '*.voc')):
+        entity_type = splitext(basename(path))[0]
+        with open(path) as f:
+            for line in f:
+                if line.strip():
+                    engine.register_entity(line.strip(), entity_type)
+    for path in glob.glob(join(SKILL_DIR, 'regex', language, '*.rx')):
+        with open(path) as f:
+            for line in f:
+                if line.strip():
+                    engine.register_regex_entity(line.strip())
+    for name in module_names:
+        engine.register_entity(name, 'ModuleKeywords')
+    for intent in skill_intents():
+        engine.register_intent_parser(intent)
+    return engine
+
+
+def load_utterances():
+    utterances = []
+    for path in sorted(glob.glob(join(SKILL_DIR, 'test', 'intent', '*.intent.json'))):
+        with open(path) as f:
+            utterances.append(json.load(f)['utterance'])
+    return utterances
+
+
+def measure(engine, utterances, iterations):
+    def parse_all():
+        for utterance in utterances:
+            for _ in engine.determine_intent(utterance):
+                pass
+    seconds = min(timeit.repeat(parse_all, number=iterations, repeat=3))
+    return seconds / (iterations * len(utterances)) * 1e3
+
+
+def main(iterations=50):
+    with open(join(SKILL_DIR, 'AvailableModules.json')) as f:
+        catalog = json.load(f)
+    everything = sorted(set(item['mycroftname'] for item in catalog['moduleData']))
+    identifiers = dict((name, 'module_{}_{}'.format(i, name)) for i, name in enumerate(DEFAULT_MIRROR))
+    installed = ModuleIndex(load_catalog(join(SKILL_DIR, 'AvailableModules.json'), tempfile.mkdtemp()),
+                            identifiers).installed_names('en-us')
+
+    utterances = load_utterances()
+    before = measure(build_engine(everything), utterances, iterations)
+    after = measure(build_engine(installed), utterances, iterations)
+    print('{} utterances, {} iterations'.format(len(utterances), iterations))
+    print('all catalog names ({:>3} keywords): {:.3f} ms/utterance'.format(len(everything), before))
+    print('installed modules ({:>3} keywords): {:.3f} ms/utterance'.format(len(installed), after))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:2]])
@@ -0,0 +1,211 @@
+# End to end latency of the skill against the MagicMirror stand-in (test/mirror_stand_in.py).
+#
+#   python test/benchmarks/mirror_benchmark.py --iterations 200 --latency 0.02 --jitter 0.01
+#
+# Loads the skill the way Mycroft does, from a copy of the skill folder with an ip.json pointing at
+# the stand-in, on a mocked messagebus. Then it times:
+#   initialize          until the skill is connected and has resolved its module identifiers
+#   module command      handle_module_command for 'hide clock' / 'show clock', and a three module command
+#   page burst          three 'next page' at once, and hide/show/hide of the clock at once, with how many
+#                       requests the command scheduler turned them into
+#   kalliope events     the five Kalliope event handlers, and how long the notifications take to reach the mirror
+# and prints p50/p95/p99 latency and throughput for each. With --kalliope-stream the Kalliope
+# notifications go over the WebSocket instead of a POST each. With --mirrors N the skill controls N
+# stand-ins, the n-th one 1 + n times slower than the first, and --dead-mirror adds one that is
+# switched off. Needs mycroft-core installed.
+
+import argparse
+import importlib.util
+import json
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from os.path import dirname, abspath, join
+from unittest.mock import MagicMock
+
+from mycroft.messagebus.message import Message
+
+TEST_DIR = dirname(dirname(abspath(__file__)))
+SKILL_DIR = dirname(TEST_DIR)
+sys.path.insert(0, TEST_DIR)
+
+from mirror_stand_in import MirrorStandIn  # noqa: E402
+
+
+def percentile(samples, p):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(p / 100.0 * (len(ordered) - 1))))]
+
+
+def report(name, samples, seconds=None):
+    seconds = seconds if seconds is not None else sum(samples)
+    print('{:<24} n={:<5} p50={:8.2f}ms p95={:8.2f}ms p99={:8.2f}ms {:8.1f}/s'.format(
+        name, len(samples), percentile(samples, 50) * 1e3, percentile(samples, 95) * 1e3,
+        percentile(samples, 99) * 1e3, len(samples) / seconds))
+
+
+def load_skill(stand_ins, workdir, settings=None, dead_mirror=False):
+    # A copy of the skill, so the ip.json and the catalog cache of the benchmark never touch the real one
+    skill_dir = join(workdir, 'magic-mirror-voice-control-skill')
+    shutil.copytree(SKILL_DIR, skill_dir, ignore=shutil.ignore_patterns('.git', 'test', '__pycache__'))
+    mirrors = [{'name': 'mirror {}'.format(i), 'ipAddress': stand_in.host, 'port': stand_in.port}
+               for i, stand_in in enumerate(stand_ins)]
+    if dead_mirror:
+        # Nothing listens on the discard port, connections are refused straight away
+        mirrors.append({'name': 'dead', 'ipAddress': '127.0.0.1', 'port': 9})
+    with open(join(skill_dir, 'ip.json'), 'w') as f:
+        if len(mirrors) == 1:
+            json.dump({'ipAddress': stand_ins[0].host, 'port': stand_ins[0].port}, f)
+        else:
+            json.dump({'mirrors': mirrors}, f)
+    spec = importlib.util.spec_from_file_location('magic_mirror_voice_control_skill', join(skill_dir, '__init__.py'),
+                                                  submodule_search_locations=[skill_dir])
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[spec.name] = module
+    spec.loader.exec_module(module)
+    skill = module.create_skill()
+    skill.bind(MagicMock())
+    skill.file_system.path = workdir
+    skill.settings.update(settings or {})
+    return skill
+
+
+def ready(skill):
+    return all(mirror.connectionStatus == 'connected' and mirror.installed is not None
+               for mirror in skill.mirrors if mirror.name != 'dead')
+
+
+def wait_for(condition, timeout=10):
+    deadline = time.time() + timeout
+    while not condition():
+        if time.time() > deadline:
+            raise RuntimeError('Timed out waiting for the skill')
+        time.sleep(0.001)
+
+
+def bench_initialize(stand_ins, iterations, dead_mirror):
+    samples = []
+    for i in range(iterations):
+        workdir = tempfile.mkdtemp()
+        try:
+            skill = load_skill(stand_ins, workdir, dead_mirror=dead_mirror)
+            start = time.time()
+            skill.initialize()
+            wait_for(lambda: ready(skill))
+            samples.append(time.time() - start)
+            skill.shutdown()
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+    return samples
+
+
+def bench_module_command(skill, utterances, iterations):
+    samples = []
+    for i in range(iterations):
+        action, modules = utterances[i % len(utterances)]
+        message = Message('ModuleActionIntent', {'ModuleActionKeywords': action, 'ModuleKeywords': modules[0],
+                                                 'utterance': '{} {}'.format(action, ' and '.join(modules))})
+        start = time.time()
+        skill.handle_module_command(message)
+        samples.append(time.time() - start)
+    return samples
+
+
+def bench_burst(skill, stand_in, messages, iterations):
+    # All of messages at once, the way the messagebus runs handlers, timed until the last one has answered
+    samples = []
+    sent = len(stand_in.requests)
+    for i in range(iterations):
+        threads = [threading.Thread(target=handler, args=(message,)) for handler, message in messages]
+        start = time.time()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        samples.append(time.time() - start)
+    return samples, len(stand_in.requests) - sent
+
+
+def bench_kalliope(skill, stand_in, iterations):
+    mirror = skill.mirrors[0]
+    events = [
+        (skill.handle_listen, Message('recognizer_loop:wakeword', {})),
+        (skill.handle_utterance, Message('recognizer_loop:utterance', {'utterances': ['hide clock']})),
+        (skill.handle_speak, Message('speak', {'utterance': 'done'})),
+        (skill.handle_output, Message('recognizer_loop:audio_output_start', {})),
+        (skill.handle_output_end, Message('recognizer_loop:audio_output_end', {})),
+    ]
+    samples = []
+    received = len(stand_in.kalliope)
+    start = time.time()
+    for i in range(iterations):
+        for handler, message in events:
+            call = time.time()
+            handler(message)
+            samples.append(time.time() - call)
+    # Everything that is not coalesced or dropped reaches the mirror, wait for the queue to drain. Streamed
+    # frames are not answered, so then wait until the stand-in has stopped receiving them as well.
+    wait_for(lambda: not mirror.kalliope._queue, timeout=60)
+    delivered, end = len(stand_in.kalliope), time.time()
+    while time.time() - end < 0.2:
+        time.sleep(0.01)
+        if len(stand_in.kalliope) != delivered:
+            delivered, end = len(stand_in.kalliope), time.time()
+    return samples, delivered - received, mirror.kalliope.dropped, end - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description='End to end latency of the skill against the MagicMirror stand-in')
+    parser.add_argument('--iterations', type=int, default=100)
+    parser.add_argument('--latency', type=float, default=0.02)
+    parser.add_argument('--jitter', type=float, default=0.01)
+    parser.add_argument('--failure-rate', type=float, default=0.0)
+    parser.add_argument('--kalliope-stream', action='store_true', help='stream the Kalliope notifications')
+    parser.add_argument('--mirrors', type=int, default=1, help='number of stand-ins the skill controls')
+    parser.add_argument('--dead-mirror', action='store_true', help='add a mirror that is switched off')
+    args = parser.parse_args()
+
+    stand_ins = [MirrorStandIn(latency=args.latency * (1 + i), jitter=args.jitter, failure_rate=args.failure_rate,
+                               seed=1 + i).start() for i in range(args.mirrors)]
+    stand_in = stand_ins[0]
+    print('{} stand-in(s){}, latency {:.0f}ms +/- {:.0f}ms, failure rate {:.1%}'.format(
+        len(stand_ins), ' and a dead mirror' if args.dead_mirror else '', args.latency * 1e3, args.jitter * 1e3,
+        args.failure_rate))
+    workdir = tempfile.mkdtemp()
+    try:
+        report('initialize', bench_initialize(stand_ins, max(1, args.iterations // 10), args.dead_mirror))
+
+        skill = load_skill(stand_ins, workdir, {'kalliope_stream': args.kalliope_stream}, args.dead_mirror)
+        skill.initialize()
+        wait_for(lambda: ready(skill))
+        report('module command', bench_module_command(skill, [('hide', ['clock']), ('show', ['clock'])],
+                                                      args.iterations))
+        report('three module command', bench_module_command(
+            skill, [('hide', ['clock', 'calendar', 'compliments']), ('show', ['clock', 'calendar', 'compliments'])],
+            args.iterations))
+
+        for name, messages in (
+                ('page burst', [(skill.handle_pages_command, Message('HandleSwipeIntent', {
+                    'SwipeActionKeywords': 'page', 'LeftRightKeywords': 'next', 'utterance': 'next page'}))] * 3),
+                ('hide/show/hide burst', [(skill.handle_module_command, Message('ModuleActionIntent', {
+                    'ModuleActionKeywords': action, 'ModuleKeywords': 'clock', 'utterance': action + ' clock'}))
+                    for action in ('hide', 'show', 'hide')])):
+            samples, requests = bench_burst(skill, stand_in, messages, args.iterations)
+            report(name, samples)
+            print('{:<24} {} commands sent as {} requests'.format('', len(samples) * len(messages), requests))
+
+        samples, delivered, dropped, seconds = bench_kalliope(skill, stand_in, args.iterations)
+        report('kalliope event handlers', samples)
+        print('{:<24} {} of {} notifications delivered, {} dropped by the full queue, {:.1f}/s, {} stream(s)'.format(
+            'kalliope delivery', delivered, len(samples), dropped, delivered / seconds, stand_in.streams))
+        skill.shutdown()
+    finally:
+        for stand_in in stand_ins:
+            stand_in.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
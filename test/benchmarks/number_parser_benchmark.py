@@ -0,0 +1,53 @@
+# Throughput benchmark for the brightness value parser.
+#
+#   python test/benchmarks/number_parser_benchmark.py [iterations]
+#
+# Checks the parser against a set of known utterances, then reports how many brightness values
+# it parses per second.
+
+import sys
+import timeit
+from os.path import dirname, abspath
+
+sys.path.insert(0, dirname(dirname(dirname(abspath(__file__)))))
+
+from number_parser import parse_brightness  # noqa: E402
+
+EXPECTED = {
+    '10': 10,
+    '85': 85,
+    '85%': 170,
+    '85 percent': 170,
+    'eighty five percent': 170,
+    'eighty five per cent': 170,
+    'one hundred and twenty five': 125,
+    'one hundred twenty five': 125,
+    'one twenty five': 125,
+    'a hundred': 100,
+    'two hundred': 200,
+    'five': 10,
+    'three hundred': 200,
+    'fifty percent': 100,
+    'one hundred percent': 200,
+}
+
+
+def main(iterations=20000):
+    for utterance, expected in EXPECTED.items():
+        value = parse_brightness(utterance)
+        assert value == expected, '{!r} parsed as {}, expected {}'.format(utterance, value, expected)
+
+    utterances = list(EXPECTED)
+
+    def parse_all():
+        for utterance in utterances:
+            parse_brightness(utterance)
+
+    seconds = min(timeit.repeat(parse_all, number=iterations, repeat=3))
+    parsed = iterations * len(utterances)
+    print('parsed {} values in {:.3f}s'.format(parsed, seconds))
+    print('{:.0f} values/s, {:.2f} us/value'.format(parsed / seconds, seconds / parsed * 1e6))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:2]])
@@ -0,0 +1,241 @@
+# A stand-in for a MagicMirror running MMM-Remote-Control and MMM-kalliope.
+#
+# It answers /remote and /kalliope the way the real modules do, with configurable latency, jitter,
+# failure rate and MODULE_DATA, so the skill can be exercised and benchmarked without a mirror.
+# MMM-pages is there too, with PAGES pages, and follows PAGE_CHANGED/PAGE_INCREMENT/PAGE_DECREMENT.
+# It also accepts the Kalliope WebSocket at /kalliope/stream, unless started with --no-stream to
+# look like a mirror that doesn't have it.
+#
+#   python test/mirror_stand_in.py --port 8080 --latency 0.05 --jitter 0.02 --failure-rate 0.01
+#
+# Point the skill at it by putting the address and port in ip.json. MirrorStandIn can also be
+# started from Python, see test/benchmarks/mirror_benchmark.py.
+
+import argparse
+import base64
+import hashlib
+import json
+import random
+import struct
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from urllib.parse import urlparse, parse_qs
+
+# The modules of a default MagicMirror config.js plus the ones this skill works with
+DEFAULT_MODULES = ['alert', 'updatenotification', 'clock', 'calendar', 'compliments', 'currentweather',
+                   'weatherforecast', 'newsfeed', 'MMM-Remote-Control', 'MMM-kalliope', 'MMM-pages']
+
+# The MMM-pages config, the modules on each page
+PAGES = [['clock', 'calendar'], ['currentweather', 'weatherforecast'], ['newsfeed'], ['compliments']]
+
+
+def module_data(names):
+    # MODULE_DATA entries the way MMM-Remote-Control numbers them, in config.js order
+    data = [{'identifier': 'module_{}_{}'.format(i, name), 'name': name, 'hidden': False, 'position': 'top_left'}
+            for i, name in enumerate(names)]
+    for module in data:
+        if module['name'] == 'MMM-pages':
+            module['config'] = {'modules': PAGES, 'rotationTime': 0}
+    return data
+
+
+# RFC 6455, the key the client sends is hashed with this to accept the upgrade
+WEBSOCKET_GUID = '258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+OPCODE_TEXT, OPCODE_CLOSE, OPCODE_PING, OPCODE_PONG = 0x1, 0x8, 0x9, 0xA
+
+
+def read_frame(rfile):
+    # One frame from a client, which always masks. Fragmented messages are not needed here.
+    head = rfile.read(2)
+    if len(head) < 2:
+        return None, b''
+    opcode, length = head[0] & 0x0F, head[1] & 0x7F
+    if length == 126:
+        length = struct.unpack('>H', rfile.read(2))[0]
+    elif length == 127:
+        length = struct.unpack('>Q', rfile.read(8))[0]
+    mask = rfile.read(4) if head[1] & 0x80 else b'\0\0\0\0'
+    data = rfile.read(length)
+    return opcode, bytes(b ^ mask[i % 4] for i, b in enumerate(data))
+
+
+def write_frame(wfile, opcode, data=b''):
+    if len(data) < 126:
+        head = struct.pack('>BB', 0x80 | opcode, len(data))
+    else:
+        head = struct.pack('>BBH', 0x80 | opcode, 126, len(data))
+    wfile.write(head + data)
+    wfile.flush()
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class MirrorStandIn(object):
+
+    def __init__(self, modules=None, latency=0.0, jitter=0.0, failure_rate=0.0, host='127.0.0.1', port=0,
+                 seed=None, stream=True):
+        self.modules = module_data(modules or DEFAULT_MODULES)
+        self.stream = stream
+        self.page = 0
+        self.streams = 0
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.random = random.Random(seed)
+        self.requests = []
+        self.kalliope = []
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        self.host, self.port = self.server.server_address[:2]
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, name='MirrorStandIn')
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def set_modules(self, names):
+        # Swap in a new config.js, identifiers are renumbered like on a real mirror
+        with self.lock:
+            self.modules = module_data(names)
+
+    def _delay(self):
+        delay = self.latency + self.random.uniform(-self.jitter, self.jitter)
+        if delay > 0:
+            time.sleep(delay)
+
+    def _failed(self):
+        return self.failure_rate and self.random.random() < self.failure_rate
+
+    def remote(self, params):
+        action = params.get('action')
+        with self.lock:
+            self.requests.append((time.time(), params))
+            if self._failed():
+                return {'status': 'error', 'reason': 'stand_in_failure'}
+            if action == 'MODULE_DATA':
+                return {'moduleData': [dict(module) for module in self.modules], 'brightness': 100}
+            if action in ('HIDE', 'SHOW'):
+                for module in self.modules:
+                    if module['identifier'] == params.get('module'):
+                        module['hidden'] = action == 'HIDE'
+                        return {'status': 'success'}
+                return {'status': 'error', 'reason': 'module_not_found'}
+            if action == 'NOTIFICATION' and params.get('notification') == 'PAGE_CHANGED':
+                self.page = int(params.get('payload', 0)) % len(PAGES)
+            elif action == 'NOTIFICATION' and params.get('notification') in ('PAGE_INCREMENT', 'PAGE_DECREMENT'):
+                # MMM-Remote-Control hands the payload of a GET to MMM-pages as a string, and MMM-pages ignores
+                # a count that isn't a number and moves one page. Refused here so a count never goes unnoticed.
+                if 'payload' in params:
+                    return {'status': 'error', 'reason': 'payload_not_a_number'}
+                step = 1 if params['notification'] == 'PAGE_INCREMENT' else -1
+                self.page = (self.page + step) % len(PAGES)
+            return {'status': 'success'}
+
+    def voice(self, form):
+        with self.lock:
+            self.kalliope.append((time.time(), form))
+            if self._failed():
+                return {'status': 'error', 'reason': 'stand_in_failure'}
+            return {'status': 'success'}
+
+    def _handler(self):
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            # Headers and body are written separately, without this every keep-alive response waits on a
+            # delayed ACK and the stand-in looks 40ms slower than it is
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                if url.path == '/kalliope/stream' and stand_in.stream:
+                    return self.stream()
+                if url.path != '/remote':
+                    return self.reply(404, {'status': 'error', 'reason': 'not_found'})
+                params = dict((key, values[-1]) for key, values in parse_qs(url.query).items())
+                stand_in._delay()
+                self.reply(200, stand_in.remote(params))
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length', 0))
+                body = self.rfile.read(length).decode('utf-8')
+                if urlparse(self.path).path != '/kalliope':
+                    return self.reply(404, {'status': 'error', 'reason': 'not_found'})
+                form = dict((key, values[-1]) for key, values in parse_qs(body).items())
+                stand_in._delay()
+                self.reply(200, stand_in.voice(form))
+
+            def stream(self):
+                # Every text frame is a {"notification": ..., "payload": ...} that is handled like a POST to
+                # /kalliope, only without a reply
+                key = self.headers.get('Sec-WebSocket-Key', '')
+                accept = base64.b64encode(hashlib.sha1((key + WEBSOCKET_GUID).encode('ascii')).digest())
+                self.send_response(101)
+                self.send_header('Upgrade', 'websocket')
+                self.send_header('Connection', 'Upgrade')
+                self.send_header('Sec-WebSocket-Accept', accept.decode('ascii'))
+                self.end_headers()
+                self.wfile.flush()
+                self.close_connection = True
+                with stand_in.lock:
+                    stand_in.streams += 1
+                while True:
+                    opcode, data = read_frame(self.rfile)
+                    if opcode is None:
+                        return
+                    if opcode == OPCODE_CLOSE:
+                        return write_frame(self.wfile, OPCODE_CLOSE, data[:2])
+                    if opcode == OPCODE_PING:
+                        write_frame(self.wfile, OPCODE_PONG, data)
+                    elif opcode == OPCODE_TEXT:
+                        stand_in._delay()
+                        stand_in.voice(json.loads(data.decode('utf-8')))
+
+            def reply(self, code, body):
+                data = json.dumps(body).encode('utf-8')
+                self.send_response(code)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Stand-in for MMM-Remote-Control and MMM-kalliope')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every response')
+    parser.add_argument('--jitter', type=float, default=0.0, help='+/- seconds of random latency')
+    parser.add_argument('--failure-rate', type=float, default=0.0, help='fraction of requests answered with an error')
+    parser.add_argument('--modules', help='comma separated module names, in config.js order')
+    parser.add_argument('--no-stream', action='store_true', help='refuse the Kalliope WebSocket like an older mirror')
+    args = parser.parse_args()
+    modules = args.modules.split(',') if args.modules else None
+    stand_in = MirrorStandIn(modules, args.latency, args.jitter, args.failure_rate, args.host, args.port,
+                             stream=not args.no_stream).start()
+    print('MagicMirror stand-in listening on http://{}:{}'.format(stand_in.host, stand_in.port))
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        stand_in.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+# Fixtures for the unit tests. The skill is loaded the way Mycroft loads it, as a package from the skill folder,
+# and utterances are parsed with Adapt against the skill's own vocab, regex and intents.
+#
+#   python -m pytest test/unittests
+#
+# Needs mycroft-core and adapt-parser installed.
+
+import glob
+import importlib.util
+import sys
+import tempfile
+from os.path import abspath, basename, dirname, join, splitext
+
+import pytest
+from adapt.engine import IntentDeterminationEngine
+from adapt.intent import IntentBuilder
+from mycroft.messagebus.message import Message
+
+SKILL_DIR = dirname(dirname(dirname(abspath(__file__))))
+PACKAGE = 'magic_mirror_voice_control_skill'
+
+
+def load_skill_module():
+    if PACKAGE not in sys.modules:
+        spec = importlib.util.spec_from_file_location(PACKAGE, join(SKILL_DIR, '__init__.py'),
+                                                      submodule_search_locations=[SKILL_DIR])
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[PACKAGE] = module
+        spec.loader.exec_module(module)
+    return sys.modules[PACKAGE]
+
+
+def skill_handlers(module):
+    # intent name -> handler, for every intent_handler of the skill that is not commented out
+    handlers = {}
+    for handler in vars(module.MagicMirrorVoiceControlSkill).values():
+        for intent in getattr(handler, 'intents', []):
+            intent = intent.build() if isinstance(intent, IntentBuilder) else intent
+            handlers[intent.name] = (intent, handler)
+    return handlers
+
+
+class FakeMirror(object):
+    # Just enough of mirrors.Mirror for the handlers, with the catalog names of every module "installed"
+
+    def __init__(self, module, catalog, language='en-us'):
+        names = dict((name, 'module_{}_{}'.format(i, name)) for i, name in enumerate(catalog.names))
+        self.name = ''
+        self.moduleIndex = module.module_catalog.ModuleIndex(catalog, names)
+        self.scenes = {}
+        self.scheduler = self
+        self.language = language
+
+    def needs(self, payload):
+        return True
+
+
+@pytest.fixture(scope='session')
+def skill_module():
+    return load_skill_module()
+
+
+@pytest.fixture(scope='session')
+def catalog(skill_module):
+    return skill_module.module_catalog.load_catalog(join(SKILL_DIR, 'AvailableModules.json'), tempfile.mkdtemp())
+
+
+@pytest.fixture(scope='session')
+def engine(skill_module, catalog):
+    # What Mycroft registers for the skill in en-us. ModuleKeywords and SceneKeywords are the catalog and scene
+    # names the skill registers when no mirror has told it which modules are installed.
+    engine = IntentDeterminationEngine()
+    for path in glob.glob(join(SKILL_DIR, 'vocab', 'en-us', '*.voc')):
+        entity_type = splitext(basename(path))[0]
+        with open(path) as f:
+            for line in f:
+                if line.strip():
+                    engine.register_entity(line.strip(), entity_type)
+    for path in glob.glob(join(SKILL_DIR, 'regex', 'en-us', '*.rx')):
+        with open(path) as f:
+            for line in f:
+                if line.strip():
+                    engine.register_regex_entity(line.strip())
+    for name in catalog.by_spoken.get('en-us', {}):
+        engine.register_entity(name, 'ModuleKeywords')
+    for scene in skill_module.load_scenes(join(SKILL_DIR, skill_module.SCENES_FILE)):
+        engine.register_entity(scene['mycroftname'], 'SceneKeywords')
+    for intent, handler in skill_handlers(skill_module).values():
+        engine.register_intent_parser(intent)
+    return engine
+
+
+@pytest.fixture
+def skill(skill_module, catalog):
+    # The skill with one fake mirror, every plan it dispatches is kept in skill.plans instead of being sent
+    skill = skill_module.create_skill()
+    skill.metrics = skill_module.Metrics()
+    skill.mirrors = [FakeMirror(skill_module, catalog)]
+    skill.targetPatterns = []
+    skill.moduleActionPattern = skill.action_pattern(join(SKILL_DIR, 'vocab', 'en-us', 'ModuleActionKeywords.voc'))
+    skill.plans = []
+    skill.available = lambda mirrors: True
+    skill.dispatch = skill.plans.append
+    return skill
+
+
+@pytest.fixture
+def say(skill_module, engine, skill):
+    # Parses an utterance with Adapt and runs the handler of the intent it resolves to, the way Mycroft does.
+    # Returns the intent name, None if nothing matched.
+    handlers = skill_handlers(skill_module)
+
+    def say(utterance):
+        intent = next(engine.determine_intent(utterance), None)
+        if intent is None:
+            return None
+        data = dict(intent, utterance=utterance)
+        handlers[intent['intent_type']][1](skill, Message(intent['intent_type'], data))
+        return intent['intent_type']
+    return say
@@ -0,0 +1,116 @@
+import sys
+from os.path import join
+
+import pytest
+
+from conftest import SKILL_DIR
+
+
+@pytest.fixture(scope='module')
+def scheduler(skill_module):
+    return skill_module.command_scheduler
+
+
+def visibility(action, module='module_0_clock'):
+    return {'action': action, 'module': module}
+
+
+def page(notification, count=None):
+    payload = {'action': 'NOTIFICATION', 'notification': notification}
+    if count is not None:
+        payload['payload'] = count
+    return payload
+
+
+def test_hide_show_hide_is_one_hide(scheduler):
+    payloads = [visibility('HIDE'), visibility('SHOW'), visibility('HIDE')]
+    assert scheduler.coalesce(payloads) == [visibility('HIDE')]
+
+
+def test_last_brightness_wins(scheduler):
+    payloads = [{'action': 'BRIGHTNESS', 'value': value} for value in (50, 200, 120)]
+    assert scheduler.coalesce(payloads) == [{'action': 'BRIGHTNESS', 'value': 120}]
+
+
+@pytest.mark.parametrize('pages', [None, 5])
+def test_moves_that_cancel_out_are_not_sent(scheduler, pages):
+    payloads = [page('PAGE_INCREMENT'), page('PAGE_INCREMENT'), page('PAGE_DECREMENT', 2)]
+    assert scheduler.coalesce(payloads, pages) == []
+
+
+def test_moves_are_sent_relative_even_when_the_pages_are_known(scheduler):
+    # The page the mirror is on may have been changed by touch, only the net move is sent
+    assert scheduler.coalesce([page('PAGE_INCREMENT')] * 2, 5) == [page('PAGE_INCREMENT')] * 2
+    assert scheduler.coalesce([page('PAGE_DECREMENT'), page('PAGE_DECREMENT', 2), page('PAGE_INCREMENT')],
+                              5) == [page('PAGE_DECREMENT')] * 2
+
+
+@pytest.mark.parametrize('pages', [None, 10])
+def test_moves_are_sent_one_page_at_a_time(scheduler, pages):
+    # MMM-pages moves one page for a count it gets as a string, which is all a GET can carry
+    payloads = [page('PAGE_INCREMENT')] * 2 + [page('PAGE_INCREMENT', 2)]
+    assert scheduler.coalesce(payloads, pages) == [page('PAGE_INCREMENT')] * 4
+
+
+@pytest.mark.parametrize('moves, sent', [
+    ([page('PAGE_INCREMENT')] * 4, [page('PAGE_DECREMENT')]),
+    ([page('PAGE_DECREMENT')] * 3, [page('PAGE_INCREMENT')] * 2),
+    ([page('PAGE_INCREMENT')] * 5, []),
+    ([page('PAGE_INCREMENT', 12)], [page('PAGE_INCREMENT')] * 2),
+])
+def test_moves_go_the_short_way_round(scheduler, moves, sent):
+    assert scheduler.coalesce(moves, 5) == sent
+
+
+def test_last_page_changed_wins(scheduler):
+    assert scheduler.coalesce([page('PAGE_CHANGED', 1), page('PAGE_CHANGED', 3)], 5) == [page('PAGE_CHANGED', 3)]
+
+
+@pytest.mark.parametrize('moves, target', [
+    ([page('PAGE_INCREMENT')] * 2, 0),
+    ([page('PAGE_INCREMENT', 7)], 0),
+    ([page('PAGE_DECREMENT')] * 4, 4),
+])
+def test_moves_after_page_changed_wrap_around(scheduler, moves, target):
+    payloads = [page('PAGE_INCREMENT'), page('PAGE_CHANGED', 3)] + moves
+    assert scheduler.coalesce(payloads, 5) == [page('PAGE_CHANGED', target)]
+
+
+def test_moves_after_page_changed_without_a_page_count(scheduler):
+    payloads = [page('PAGE_CHANGED', 3), page('PAGE_INCREMENT'), page('PAGE_INCREMENT')]
+    assert scheduler.coalesce(payloads) == [page('PAGE_CHANGED', 3), page('PAGE_INCREMENT'), page('PAGE_INCREMENT')]
+
+
+def test_command_key(scheduler):
+    assert scheduler.command_key(visibility('HIDE')) == scheduler.command_key(visibility('SHOW'))
+    assert scheduler.command_key(visibility('HIDE')) != scheduler.command_key(visibility('HIDE', 'module_1_news'))
+    assert scheduler.command_key(page('PAGE_CHANGED', 1)) == scheduler.command_key(page('PAGE_INCREMENT'))
+    assert scheduler.command_key({'action': 'SHUTDOWN'}) is None
+
+
+@pytest.mark.parametrize('config, pages', [
+    ({'modules': [['clock'], ['calendar'], ['newsfeed']]}, 3),
+    ({'modules': [['clock'], ['calendar']], 'rotationTime': 20000}, 2),
+    ({}, None),
+])
+def test_page_count(scheduler, config, pages):
+    data = {'moduleData': [{'name': 'clock'}, {'name': 'MMM-pages', 'config': config}]}
+    assert scheduler.page_count(data) == pages
+    assert scheduler.page_count({'moduleData': [{'name': 'clock'}]}) is None
+
+
+def test_a_burst_of_moves_turns_the_stand_in_pages(skill_module, scheduler):
+    # Through MMM-Remote-Control's GET, which the stand-in refuses any page count on like MMM-pages would ignore it
+    sys.path.insert(0, join(SKILL_DIR, 'test'))
+    from mirror_stand_in import MirrorStandIn, PAGES
+    stand_in = MirrorStandIn(latency=0.05).start()
+    try:
+        client = skill_module.mirror_client.MirrorClient(stand_in.host, stand_in.port)
+        connection = skill_module.connection_manager.ConnectionManager(client)
+        commands = scheduler.CommandScheduler(connection, skill_module.module_catalog.ModuleVisibility())
+        results = commands.send_all([page('PAGE_INCREMENT')] * 3 + [page('PAGE_DECREMENT')])
+        commands.stop()
+        assert [status for payload, status in results] == [{'status': 'success'}] * 4
+        assert stand_in.page == 2 % len(PAGES)
+    finally:
+        stand_in.stop()
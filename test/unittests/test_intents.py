@@ -0,0 +1,80 @@
+import glob
+import json
+from os.path import join
+
+import pytest
+from mycroft.messagebus.message import Message
+
+from conftest import SKILL_DIR
+
+# Intents whose handlers are commented out in __init__.py but still have samples in test/intent
+DISABLED_INTENTS = ('SystemActionIntent', 'ListInstalledModulesIntent')
+
+
+def sent(skill):
+    return [payload for plan in skill.plans for mirror, payloads, modules in plan for payload in payloads]
+
+
+@pytest.mark.parametrize('utterance, value', [
+    ('set brightness to one hundred and twenty five', 125),
+    ('set brightness to eighty percent', 160),
+    ('set brightness to eighty five percent', 170),
+    ('set brightness to fifty', 50),
+    ('adjust brightness to 85%', 170),
+    ('change brightness to ten', 10),
+    ('set mirror brightness at two hundred', 200),
+    ('set brightness to one oh five', 105),
+    ('set brightness to one two five', 125),
+    ('set brightness to fifty five point five', 56),
+    ('set brightness to fifty point five percent', 101),
+])
+def test_brightness_value_is_read_from_the_whole_utterance(say, skill, utterance, value):
+    assert say(utterance) == 'AdjustBrightnessIntent'
+    assert sent(skill) == [{'action': 'BRIGHTNESS', 'value': value}]
+
+
+def test_brightness_without_a_value_is_an_incorrect_command(say, skill):
+    assert say('set brightness to') == 'AdjustBrightnessIntent'
+    assert sent(skill) == []
+
+
+def load_samples():
+    samples = []
+    for path in sorted(glob.glob(join(SKILL_DIR, 'test', 'intent', '*.intent.json'))):
+        with open(path) as f:
+            samples.append(json.load(f))
+    return samples
+
+
+@pytest.mark.parametrize('sample', load_samples(), ids=lambda sample: sample['utterance'])
+def test_intent_samples_match_without_a_mirror(engine, sample):
+    # The skill has registered the catalog names since no mirror has answered, the way Mycroft's intent tests run it
+    if sample['intent_type'] in DISABLED_INTENTS:
+        pytest.skip('{} is commented out'.format(sample['intent_type']))
+    intent = next(engine.determine_intent(sample['utterance']), None)
+    assert intent is not None and intent['intent_type'] == sample['intent_type']
+    for keyword, value in sample['intent'].items():
+        assert intent.get(keyword) == value
+
+
+@pytest.mark.parametrize('utterance', [
+    'turn off the lights',
+    'turn on the kitchen light',
+    'update yourself',
+    'add milk to my shopping list',
+])
+def test_unrelated_commands_are_left_to_other_skills(say, skill, utterance):
+    assert say(utterance) is None
+    assert skill.handle_module_fallback(Message('fallback', {'utterance': utterance})) is False
+    assert skill.plans == []
+
+
+@pytest.mark.parametrize('utterance, module', [
+    ('hide the wonder ground', 'module_{}_MMM-WunderGround'),
+    ('show the news feeds', 'module_{}_newsfeed'),
+])
+def test_near_misses_are_claimed_by_the_fallback(say, skill, catalog, utterance, module):
+    assert say(utterance) is None
+    assert skill.handle_module_fallback(Message('fallback', {'utterance': utterance})) is True
+    identifiers = [payload['module'] for payload in sent(skill)]
+    assert module.format(catalog.names.index(module.split('_', 2)[2])) in identifiers
@@ -0,0 +1,19 @@
+from mycroft.messagebus.message import Message
+
+
+class FakeForwarder(object):
+
+    def __init__(self):
+        self.sent = []
+
+    def send(self, notification, payload):
+        self.sent.append((notification, payload))
+
+
+def test_utterance_is_forwarded_as_a_string(skill):
+    # The stream json-encodes the payload, a list would reach MMM-kalliope as a list
+    forwarder = skill.mirrors[0].kalliope = FakeForwarder()
+    skill.kalliope_mirrors = lambda: skill.mirrors
+    skill.handle_utterance(Message('recognizer_loop:utterance', {'utterances': ['hide clock', 'hide the clock']}))
+    skill.handle_utterance(Message('recognizer_loop:utterance', {}))
+    assert forwarder.sent == [('KALLIOPE', 'hide clock'), ('KALLIOPE', '')]